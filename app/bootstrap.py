@@ -1,12 +1,24 @@
-from sqlalchemy import select
+from sqlalchemy import select, text
 from .db import engine, SessionLocal
-from .models import Base, RackState, RackSchedule
+from .models import Base, RackState, RackSchedule, RackSensorHistory
 
 _EMPTY = {"mon": [], "tue": [], "wed": [], "thu": [], "fri": [], "sat": [], "sun": []}
 
 async def ensure_db_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_migrate_history_indexes)
+
+
+def _migrate_history_indexes(conn):
+    """
+    create_all не добавляет индексы в уже существующие таблицы.
+    Составной (rack_id, created_at) создаём отдельно (если его нет), после чего
+    одиночный индекс по rack_id лишний — он только замедляет вставку.
+    """
+    for index in RackSensorHistory.__table__.indexes:
+        index.create(conn, checkfirst=True)
+    conn.execute(text("DROP INDEX IF EXISTS ix_rack_sensor_history_rack_id"))
 
 async def ensure_db_racks(racks_count: int):
     async with SessionLocal() as s:
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+# Приоритеты транзакций на шине: меньше — важнее
+PRIO_RELAY = 0
+PRIO_VERIFY = 1
+PRIO_SENSOR = 2
+
+PRIORITY_NAMES = {PRIO_RELAY: "relay", PRIO_VERIFY: "verify", PRIO_SENSOR: "sensor"}
+
+# За какой период считать загрузку шины и перцентили ожидания
+_STATS_WINDOW_SEC = 60.0
+_WAIT_SAMPLES = 200
+
+
+class BusDeadlineError(TimeoutError):
+    """Транзакция не успела начаться до своего срока — шина была занята более важными."""
+
+
+@dataclass(eq=False)
+class _Job:
+    fn: Callable[[], Awaitable[Any]]
+    priority: int
+    name: str
+    deadline: Optional[float]
+    preemptible: bool
+    preempt_after: float
+    key: Optional[Hashable]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    preempted: bool = False
+
+
+class _PrioStats:
+    def __init__(self):
+        self.count = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.waits: deque[float] = deque(maxlen=_WAIT_SAMPLES)
+        self.deadline_missed = 0
+        self.preempted = 0
+        self.collapsed = 0
+
+    def as_dict(self) -> dict:
+        waits = sorted(self.waits)
+        p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+        return {
+            "count": self.count,
+            "wait_avg_ms": round(self.wait_sum / self.count * 1000, 1) if self.count else 0.0,
+            "wait_p95_ms": round(p95 * 1000, 1),
+            "wait_max_ms": round(self.wait_max * 1000, 1),
+            "deadline_missed": self.deadline_missed,
+            "preempted": self.preempted,
+            "collapsed": self.collapsed,
+        }
+
+
+class BusScheduler:
+    """
+    Очередь транзакций на одну шину RS485 вместо простого FIFO-замка.
+
+    - Транзакции идут строго по одной, сначала по приоритету (реле → сверка → датчики),
+      внутри приоритета — в порядке поступления.
+    - deadline_sec — крайний срок начала: не успевшая начаться транзакция
+      завершается BusDeadlineError и шину не занимает.
+    - Транзакции с одинаковым key, ещё ждущие в очереди, сливаются в одну:
+      все вызывающие получают результат одного выполнения.
+    - preemptible-транзакцию (чтение датчика), которая идёт дольше preempt_after_sec,
+      прерывает пришедшая более важная; прерванная встаёт обратно в очередь.
+      Так молчащий датчик с таймаутом 1 с не задерживает ручную команду реле.
+      Порог задаётся и для отдельной транзакции: он должен быть не меньше окна
+      ответа исправного устройства, иначе прерываться будут и живые датчики.
+    """
+
+    def __init__(self, preempt_after_sec: float = 0.05):
+        self.preempt_after_sec = preempt_after_sec
+
+        self._heap: list[tuple[int, int, _Job]] = []
+        self._seq = itertools.count()
+        self._keyed: dict[Hashable, _Job] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        self._current: Optional[_Job] = None
+        self._current_task: Optional[asyncio.Task] = None
+        self._current_started = 0.0
+        self._preempt_handle: Optional[asyncio.TimerHandle] = None
+
+        self._started_at = time.monotonic()
+        self._busy_total = 0.0
+        self._busy_recent: deque[tuple[float, float]] = deque()
+        self._stats: dict[int, _PrioStats] = {}
+
+    async def run(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        priority: int,
+        name: str = "",
+        deadline_sec: Optional[float] = None,
+        preemptible: bool = False,
+        key: Optional[Hashable] = None,
+        preempt_after_sec: Optional[float] = None,
+    ) -> Any:
+        """Ставит транзакцию fn() в очередь и ждёт её результата."""
+        if key is not None and key in self._keyed:
+            job = self._keyed[key]
+            self._prio_stats(job.priority).collapsed += 1
+            return await asyncio.shield(job.future)
+
+        loop = asyncio.get_running_loop()
+        job = _Job(
+            fn=fn,
+            priority=priority,
+            name=name,
+            deadline=time.monotonic() + deadline_sec if deadline_sec is not None else None,
+            preemptible=preemptible,
+            preempt_after=self.preempt_after_sec if preempt_after_sec is None else preempt_after_sec,
+            key=key,
+            future=loop.create_future(),
+        )
+        self._push(job)
+        if key is not None:
+            self._keyed[key] = job
+
+        if self._worker is None or self._worker.done():
+            self._wake = asyncio.Event()
+            self._worker = asyncio.create_task(self._loop())
+        self._wake.set()
+        self._check_preempt()
+
+        if key is not None:
+            # Результат общий: отмена одного из ожидающих не должна отменять остальных.
+            return await asyncio.shield(job.future)
+        return await job.future
+
+    def _push(self, job: _Job):
+        heapq.heappush(self._heap, (job.priority, next(self._seq), job))
+
+    def _prio_stats(self, priority: int) -> _PrioStats:
+        st = self._stats.get(priority)
+        if st is None:
+            st = self._stats[priority] = _PrioStats()
+        return st
+
+    def _check_preempt(self):
+        cur, task = self._current, self._current_task
+        if cur is None or not cur.preemptible or task is None or task.done() or not self._heap:
+            return
+        if self._heap[0][0] >= cur.priority:
+            return
+
+        running = time.monotonic() - self._current_started
+        if running >= cur.preempt_after:
+            cur.preempted = True
+            task.cancel()
+        elif self._preempt_handle is None:
+            # Даём транзакции шанс завершиться нормально: исправное устройство отвечает быстро.
+            loop = asyncio.get_running_loop()
+            self._preempt_handle = loop.call_later(cur.preempt_after - running, self._preempt_timer)
+
+    def _preempt_timer(self):
+        self._preempt_handle = None
+        self._check_preempt()
+
+    async def _loop(self):
+        while True:
+            if not self._heap:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            _, _, job = heapq.heappop(self._heap)
+            if job.key is not None and self._keyed.get(job.key) is job:
+                del self._keyed[job.key]
+            if job.future.done():
+                # Вызывающий уже отменил ожидание.
+                continue
+
+            st = self._prio_stats(job.priority)
+            now = time.monotonic()
+            if job.deadline is not None and now > job.deadline:
+                st.deadline_missed += 1
+                job.future.set_exception(BusDeadlineError(
+                    f"bus transaction {job.name or PRIORITY_NAMES.get(job.priority, job.priority)} "
+                    f"missed its deadline after {now - job.enqueued_at:.2f}s in queue"
+                ))
+                continue
+
+            if not job.preempted:
+                wait = now - job.enqueued_at
+                st.count += 1
+                st.wait_sum += wait
+                st.wait_max = max(st.wait_max, wait)
+                st.waits.append(wait)
+
+            job.preempted = False
+            self._current = job
+            self._current_started = now
+            self._current_task = task = asyncio.create_task(job.fn())
+            self._check_preempt()
+            try:
+                await asyncio.wait({task})
+            finally:
+                if self._preempt_handle is not None:
+                    self._preempt_handle.cancel()
+                    self._preempt_handle = None
+                self._current = None
+                self._current_task = None
+                self._account_busy(now, time.monotonic())
+
+            if task.cancelled():
+                if job.preempted:
+                    st.preempted += 1
+                    self._push(job)
+                elif not job.future.done():
+                    job.future.cancel()
+                continue
+
+            if job.future.done():
+                # Никто уже не ждёт; ошибку забираем, чтобы asyncio не ругался.
+                task.exception()
+                continue
+            exc = task.exception()
+            if exc is not None:
+                job.future.set_exception(exc)
+            else:
+                job.future.set_result(task.result())
+
+    def close(self):
+        """Останавливает очередь (драйвер закрывается): текущая транзакция отменяется, ждущие получают ошибку."""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        if self._current_task is not None:
+            self._current_task.cancel()
+            # Результат уже никто не заберёт — гасим его, чтобы asyncio не ругался при выходе.
+            self._current_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        if self._current is not None and not self._current.future.done():
+            self._current.future.cancel()
+        for _, _, job in self._heap:
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("RS485 bus closed"))
+        self._heap.clear()
+        self._keyed.clear()
+
+    def _account_busy(self, start: float, end: float):
+        self._busy_total += end - start
+        self._busy_recent.append((end, end - start))
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        while self._busy_recent and self._busy_recent[0][0] < now - _STATS_WINDOW_SEC:
+            self._busy_recent.popleft()
+        window = max(1e-6, min(_STATS_WINDOW_SEC, now - self._started_at))
+        busy_recent = sum(d for _, d in self._busy_recent)
+        if self._current is not None:
+            busy_recent += now - self._current_started
+
+        return {
+            "queue_depth": len(self._heap),
+            "current": (self._current.name or PRIORITY_NAMES.get(self._current.priority)) if self._current else None,
+            "utilization": round(min(1.0, busy_recent / window), 3),
+            "utilization_total": round(min(1.0, self._busy_total / max(1e-6, now - self._started_at)), 3),
+            "window_sec": round(window),
+            "priorities": {
+                PRIORITY_NAMES.get(prio, str(prio)): st.as_dict()
+                for prio, st in sorted(self._stats.items())
+            },
+        }
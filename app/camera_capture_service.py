@@ -1,32 +1,55 @@
 import asyncio
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import partial
 import os
+import shutil
+import threading
+import time
 
 from pathlib import Path
 
-from sqlalchemy import select
-from .db import SessionLocal
-from .models import RackState
+from .rack_state_store import rack_state_store
 
 from . import runtime
 from .camera_manager import camera_manager
-from .google_drive_uploader import GoogleDriveUploader
+from .upload_queue import pending_dir, upload_queue
+
+# Снимок для архива должен быть не старше этого (секунды)
+_MAX_FRAME_AGE_SEC = 3.0
+
+# Чистка архива — не чаще раза в час
+_ARCHIVE_CLEANUP_EVERY_SEC = 3600
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+    return total
 
 
 class CameraCaptureService:
     def __init__(self):
         self.task: asyncio.Task | None = None
         self.stop_event = asyncio.Event()
-        self.uploader: GoogleDriveUploader | None = None
-        self.uploader_key: tuple[str, str] | None = None
+        # Отдельный пул для съёмки: ожидание кадра и кодирование не занимают общий to_thread-пул.
+        self.executor: ThreadPoolExecutor | None = None
+        self.executor_size = 0
 
-    async def _get_light_states(self) -> dict[int, bool]:
-        async with SessionLocal() as s:
-            rows = (await s.execute(select(RackState))).scalars().all()
+        # Размер архива по папкам дней: (rack_N, YYYY-MM-DD) -> байт. Полный обход — один раз
+        # при первой чистке, дальше размер дописывается при сохранении каждого снимка.
+        self.archive_sizes: dict[tuple[str, str], int] = {}
+        self.archive_scanned = False
+        self.archive_lock = threading.Lock()
+        self.archive_cleaned_at: float | None = None
 
+    async def _get_light_states(self) -> dict[int, bool]:
         return {
-            int(row.rack_id): bool(row.light_on)
-            for row in rows
+            st.rack_id: bool(st.light_on)
+            for st in rack_state_store.all()
         }
 
     async def start(self):
@@ -47,51 +70,30 @@ class CameraCaptureService:
             except asyncio.CancelledError:
                 pass
 
-    def _get_uploader(self):
-        if not runtime.cfg:
-            return None
-
-        cfg = runtime.cfg.camera_capture
-
-        if not cfg.credentials_file or not cfg.google_folder_id or not cfg.token_file:
-            return None
-
-        key = (cfg.credentials_file, cfg.google_folder_id, cfg.token_file)
-
-        if self.uploader is None or self.uploader_key != key:
-            self.uploader = GoogleDriveUploader(
-                credentials_file=cfg.credentials_file,
-                folder_id=cfg.google_folder_id,
-                token_file=cfg.token_file,
-            )
-            self.uploader_key = key
+        if self.executor:
+            # Зависшая камера не должна держать остановку сервера.
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
 
-        return self.uploader
+    def _get_executor(self, size: int) -> ThreadPoolExecutor:
+        if self.executor is None or self.executor_size != size:
+            if self.executor:
+                self.executor.shutdown(wait=False)
+            self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="camera-capture")
+            self.executor_size = size
+        return self.executor
 
-    def _reset_uploader(self):
-        # После сетевой ошибки лучше пересоздать Google Drive service при следующей попытке.
-        if self.uploader:
-            self.uploader.service = None
+    def _save_pending_file(self, jpeg: bytes, filename: str) -> Path:
+        directory = pending_dir()
+        directory.mkdir(parents=True, exist_ok=True)
 
-    def _pending_dir(self) -> Path:
-        if runtime.cfg and runtime.cfg.camera_capture:
-            pending_dir = runtime.cfg.camera_capture.pending_dir or "data/camera_pending"
-        else:
-            pending_dir = "data/camera_pending"
-
-        return Path(pending_dir)
-
-    def _save_pending_file(self, jpeg: bytes, filename: str, reason: str):
-        pending_dir = self._pending_dir()
-        pending_dir.mkdir(parents=True, exist_ok=True)
-
-        path = pending_dir / filename
+        path = directory / filename
 
         # На всякий случай, если имя уже есть, добавим микросекунды.
         if path.exists():
             stem = path.stem
             suffix = path.suffix or ".jpg"
-            path = pending_dir / f"{stem}_{datetime.now().strftime('%f')}{suffix}"
+            path = directory / f"{stem}_{datetime.now().strftime('%f')}{suffix}"
 
         tmp_path = path.with_suffix(path.suffix + ".tmp")
 
@@ -100,40 +102,8 @@ class CameraCaptureService:
         tmp_path.write_bytes(jpeg)
         tmp_path.replace(path)
 
-        print(f"[camera-capture] saved locally {path}: {reason}")
-
-    async def _upload_pending_files(self, uploader: GoogleDriveUploader):
-        pending_dir = self._pending_dir()
-        if not pending_dir.exists():
-            return
+        return path
 
-        files = sorted(pending_dir.glob("*.jpg"))
-        if not files:
-            return
-
-        print(f"[camera-capture] pending files: {len(files)}")
-
-        # Чтобы при большом накоплении не блокировать обычные снимки слишком надолго.
-        for path in files[:50]:
-            if self.stop_event.is_set():
-                return
-
-            try:
-                data = await asyncio.to_thread(path.read_bytes)
-                result = await asyncio.to_thread(
-                    uploader.upload_jpeg_bytes,
-                    data,
-                    path.name,
-                )
-                await asyncio.to_thread(path.unlink)
-                print(f"[camera-capture] uploaded pending {path.name}: {result}")
-
-            except Exception as e:
-                self._reset_uploader()
-                print(f"[camera-capture] cannot upload pending {path.name}: {e}")
-
-                # Если интернет всё ещё недоступен, остальные файлы тоже, скорее всего, не загрузятся.
-                return
     def _archive_dir(self) -> Path:
         if runtime.cfg and runtime.cfg.camera_capture:
             archive_dir = runtime.cfg.camera_capture.local_archive_dir or "data/camera_archive"
@@ -142,12 +112,12 @@ class CameraCaptureService:
 
         return Path(archive_dir)
 
-    def _save_archive_file(self, jpeg: bytes, filename: str, rack_id: int):
+    def _save_archive_file(self, jpeg: bytes, filename: str, rack_id: int, taken_at: datetime):
         if not runtime.cfg or not runtime.cfg.camera_capture.local_archive_enabled:
             return
 
         # Храним по папкам: data/camera_archive/rack_1/2026-07-03/file.jpg
-        day = datetime.now().strftime("%Y-%m-%d")
+        day = taken_at.strftime("%Y-%m-%d")
         archive_dir = self._archive_dir() / f"rack_{rack_id}" / day
         archive_dir.mkdir(parents=True, exist_ok=True)
 
@@ -162,43 +132,127 @@ class CameraCaptureService:
         tmp_path.write_bytes(jpeg)
         tmp_path.replace(path)
 
+        if self.archive_scanned:
+            key = (f"rack_{rack_id}", day)
+            with self.archive_lock:
+                self.archive_sizes[key] = self.archive_sizes.get(key, 0) + len(jpeg)
+
         print(f"[camera-capture] saved archive {path}")
 
     async def _cleanup_archive_files(self):
         if not runtime.cfg or not runtime.cfg.camera_capture.local_archive_enabled:
             return
 
-        archive_dir = self._archive_dir()
-        if not archive_dir.exists():
+        now = time.monotonic()
+        if self.archive_cleaned_at is not None and now - self.archive_cleaned_at < _ARCHIVE_CLEANUP_EVERY_SEC:
             return
+        self.archive_cleaned_at = now
 
-        keep_days = runtime.cfg.camera_capture.local_archive_days
-        cutoff = datetime.now() - timedelta(days=keep_days)
-        deleted = 0
+        cfg = runtime.cfg.camera_capture
+        max_bytes = int(cfg.local_archive_max_gb * 1024 ** 3) if cfg.local_archive_max_gb else None
 
-        for path in archive_dir.rglob("*.jpg"):
-            if self.stop_event.is_set():
-                return
+        deleted, freed = await asyncio.to_thread(self._cleanup_archive_days, cfg.local_archive_days, max_bytes)
 
-            try:
-                mtime = datetime.fromtimestamp(path.stat().st_mtime)
-                if mtime < cutoff:
-                    await asyncio.to_thread(path.unlink)
-                    deleted += 1
-            except Exception as e:
-                print(f"[camera-capture] cannot cleanup archive file {path}: {e}")
+        if deleted:
+            print(f"[camera-capture] cleanup archive: deleted {deleted} day folders, {freed / 1024 ** 2:.1f} MB")
+
+    def _cleanup_archive_days(self, keep_days: int, max_bytes: int | None) -> tuple[int, int]:
+        """
+        Архив разложен по папкам rack_N/YYYY-MM-DD, поэтому старые снимки удаляются
+        целыми днями: смотрим только список папок, а не каждый файл.
+        """
+        archive_dir = self._archive_dir()
+        if not archive_dir.exists():
+            return 0, 0
 
-        # Удаляем пустые папки после удаления старых фото.
-        for folder in sorted(archive_dir.rglob("*"), reverse=True):
-            if folder.is_dir():
+        days: dict[tuple[str, str], str] = {}
+        for rack in os.scandir(archive_dir):
+            if not rack.is_dir() or not rack.name.startswith("rack_"):
+                continue
+            for day in os.scandir(rack.path):
+                try:
+                    date.fromisoformat(day.name)
+                except ValueError:
+                    continue
+                if day.is_dir():
+                    days[(rack.name, day.name)] = day.path
+
+        with self.archive_lock:
+            sizes = {key: self.archive_sizes[key] for key in days if key in self.archive_sizes}
+
+        # Папки, которых ещё нет в индексе (первый запуск или скопированы вручную), считаем один раз.
+        for key, path in days.items():
+            if key not in sizes:
                 try:
-                    folder.rmdir()
+                    sizes[key] = _dir_size(path)
                 except OSError:
-                    pass
+                    sizes[key] = 0
+
+        # Папка дня D целиком старше keep_days, если D раньше (сегодня − keep_days).
+        cutoff = (date.today() - timedelta(days=keep_days)).isoformat()
+        expired = [key for key in days if key[1] < cutoff]
+
+        if max_bytes is not None:
+            total = sum(size for key, size in sizes.items() if key not in expired)
+            today = date.today().isoformat()
+            # Сверх лимита — удаляем самые старые дни (кроме сегодняшнего, в него идёт запись).
+            for key in sorted(days, key=lambda k: (k[1], k[0])):
+                if total <= max_bytes or key[1] >= today:
+                    break
+                if key not in expired:
+                    expired.append(key)
+                    total -= sizes[key]
+
+        deleted = freed = 0
+        for key in expired:
+            if self.stop_event.is_set():
+                break
+            try:
+                shutil.rmtree(days[key])
+            except OSError as e:
+                print(f"[camera-capture] cannot cleanup archive folder {days[key]}: {e}")
+                continue
+            deleted += 1
+            freed += sizes.pop(key)
 
-        if deleted:
-            print(f"[camera-capture] cleanup archive: deleted {deleted} old files")
+        # Пустые папки полок (камеру убрали из конфига).
+        for rack in {key[0] for key in days}:
+            try:
+                (archive_dir / rack).rmdir()
+            except OSError:
+                pass
+
+        with self.archive_lock:
+            # Новые снимки, сохранённые за время чистки, уже добавились к индексу — не затираем их.
+            for key, size in sizes.items():
+                self.archive_sizes[key] = max(size, self.archive_sizes.get(key, 0))
+            for key in list(self.archive_sizes):
+                if key not in sizes:
+                    del self.archive_sizes[key]
+            self.archive_scanned = True
+
+        return deleted, freed
+
+    def archive_stats(self) -> dict:
+        cfg = runtime.cfg.camera_capture if runtime.cfg else None
 
+        with self.archive_lock:
+            sizes = dict(self.archive_sizes)
+
+        racks: dict[str, int] = {}
+        for (rack, _), size in sizes.items():
+            racks[rack] = racks.get(rack, 0) + size
+
+        return {
+            "enabled": bool(cfg and cfg.local_archive_enabled),
+            "scanned": self.archive_scanned,
+            "bytes": sum(sizes.values()),
+            "days": len({day for _, day in sizes}),
+            "oldest_day": min((day for _, day in sizes), default=None),
+            "racks": racks,
+            "keep_days": cfg.local_archive_days if cfg else None,
+            "max_bytes": int(cfg.local_archive_max_gb * 1024 ** 3) if cfg and cfg.local_archive_max_gb else None,
+        }
 
     async def _run(self):
         await asyncio.sleep(5)
@@ -226,41 +280,88 @@ class CameraCaptureService:
         if not cfg.enabled:
             return
 
-        uploader = self._get_uploader()
-
-        # В начале каждого цикла сначала пытаемся отправить накопленные локальные фото.
-        # Если интернета нет, файлы останутся в локальной очереди до следующей попытки.
-        if uploader is not None:
-            await self._upload_pending_files(uploader)
-        else:
-            print("[camera-capture] Google Drive не настроен: credentials_file, token_file или google_folder_id пустые")
-
-        # Каждый цикл чистим локальный архив: оставляем только последние local_archive_days дней.
+        # Чистим локальный архив (не чаще раза в час): оставляем последние local_archive_days дней
+        # и укладываемся в local_archive_max_gb.
         await self._cleanup_archive_files()
 
         light_states = await self._get_light_states()
+        jobs = self._capture_jobs(cfg, light_states)
+        if not jobs:
+            return
+
+        # Одна метка времени на весь цикл: кадры всех полок ложатся в таймлапс рядом.
+        taken_at = datetime.now()
+        stamp = taken_at.strftime("%Y%m%d_%H%M%S")
+
+        executor = self._get_executor(cfg.max_parallel)
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + cfg.capture_timeout_seconds
+        futures = {
+            loop.run_in_executor(
+                executor, partial(self._capture_rack, rack_id, device, kwargs, stamp, taken_at, deadline)
+            ): rack_id
+            for rack_id, device, kwargs in jobs
+        }
 
-        quality = cfg.jpeg_quality
-        frame_width = cfg.frame_width
-        frame_height = cfg.frame_height
+        # Все камеры снимают одновременно; кто не успел к сроку — пропускает этот цикл.
+        done, pending = await asyncio.wait(futures, timeout=cfg.capture_timeout_seconds)
+        for fut in pending:
+            fut.cancel()
+            print(f"[camera-capture] timeout: rack={futures[fut]}, no frame in {cfg.capture_timeout_seconds}s")
+
+        shots = []
+        for fut in done:
+            try:
+                shot = fut.result()
+            except Exception as e:
+                print(f"[camera-capture] capture error: rack={futures[fut]}: {e}")
+                continue
+            if shot:
+                shots.append(shot)
+
+        # Отправкой в Google Drive занимается upload_queue по своему расписанию:
+        # здесь фото только кладутся в очередь, съёмка не ждёт сеть.
+        for rack_id, filename, jpeg in sorted(shots):
+            path = await asyncio.to_thread(self._save_pending_file, jpeg, filename)
+            await upload_queue.enqueue(path)
+            print(f"[camera-capture] queued for upload {path}")
+
+    def _capture_jobs(self, cfg, light_states: dict[int, bool]) -> list[tuple[int, str, dict]]:
+        """Список (rack_id, device, параметры get_jpeg) для полок, которые надо снять в этом цикле."""
+        jobs = []
 
         for rack_id_str, rack_cfg in runtime.cfg.racks.items():
             rack_id = int(rack_id_str)
             camera_cfg = runtime.cfg.cameras.get(rack_cfg.camera_id) if rack_cfg.camera_id else None
 
+            kwargs = dict(
+                jpeg_quality=cfg.jpeg_quality,
+                frame_width=cfg.frame_width,
+                frame_height=cfg.frame_height,
+                max_age_sec=_MAX_FRAME_AGE_SEC,
+            )
+
             if camera_cfg:
                 device = camera_cfg.device.strip()
-                flip_vertical = camera_cfg.flip_vertical
-                flip_horizontal = camera_cfg.flip_horizontal
-                warp_enabled = camera_cfg.warp_enabled
-                warp_points = camera_cfg.warp_points
+                kwargs.update(
+                    flip_vertical=camera_cfg.flip_vertical,
+                    flip_horizontal=camera_cfg.flip_horizontal,
+                    warp_enabled=camera_cfg.warp_enabled,
+                    warp_points=camera_cfg.warp_points,
+                    autofocus_enabled=camera_cfg.autofocus_enabled,
+                    focus_absolute=camera_cfg.focus_absolute,
+                    white_balance_auto=camera_cfg.white_balance_auto,
+                    white_balance_temperature=camera_cfg.white_balance_temperature,
+                )
             else:
-                # Совместимость со старым config/kisamore.yaml.
+                # Совместимость со старым config/kisamore.yaml: фокус и баланс белого — по умолчанию.
                 device = (rack_cfg.camera_device or "").strip()
-                flip_vertical = rack_cfg.camera_flip_vertical
-                flip_horizontal = rack_cfg.camera_flip_horizontal
-                warp_enabled = rack_cfg.camera_warp_enabled
-                warp_points = rack_cfg.camera_warp_points
+                kwargs.update(
+                    flip_vertical=rack_cfg.camera_flip_vertical,
+                    flip_horizontal=rack_cfg.camera_flip_horizontal,
+                    warp_enabled=rack_cfg.camera_warp_enabled,
+                    warp_points=rack_cfg.camera_warp_points,
+                )
 
             if not device:
                 continue
@@ -273,48 +374,38 @@ class CameraCaptureService:
                 print(f"[camera-capture] camera not found: rack={rack_id}, device={device}")
                 continue
 
-            jpeg = camera_manager.get_jpeg(
-                device=device,
-                jpeg_quality=quality,
-                frame_width=frame_width,
-                frame_height=frame_height,
-                flip_vertical=flip_vertical,
-                flip_horizontal=flip_horizontal,
-                warp_enabled=warp_enabled,
-                warp_points=warp_points,
-                autofocus_enabled=camera_cfg.autofocus_enabled,
-                focus_absolute=camera_cfg.focus_absolute,
-                white_balance_auto=camera_cfg.white_balance_auto,
-                white_balance_temperature=camera_cfg.white_balance_temperature,
-            )
-
-            if not jpeg:
-                print(f"[camera-capture] no frame yet: rack={rack_id}, device={device}")
-                continue
-
-            now = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"rack_{rack_id}_{now}.jpg"
-
-            # Всегда сохраняем локальную копию для таймлапсов.
-            # Она будет храниться local_archive_days дней и потом удалится автоматически.
-            self._save_archive_file(jpeg, filename, rack_id)
+            jobs.append((rack_id, device, kwargs))
+
+        return jobs
+
+    def _capture_rack(
+        self,
+        rack_id: int,
+        device: str,
+        kwargs: dict,
+        stamp: str,
+        taken_at: datetime,
+        deadline: float,
+    ) -> tuple[int, str, bytes] | None:
+        """Выполняется в пуле: ждёт свежий кадр, кодирует и кладёт копию в архив."""
+        # Без зрителей камера читает кадры редко или вообще закрыта — get_jpeg сам попросит свежий кадр.
+        jpeg = camera_manager.get_jpeg(device=device, **kwargs)
+
+        if not jpeg:
+            print(f"[camera-capture] no frame yet: rack={rack_id}, device={device}")
+            return None
 
-            if uploader is None:
-                self._save_pending_file(jpeg, filename, "Google Drive uploader is not configured")
-                continue
+        if time.monotonic() > deadline:
+            # Цикл уже закрыт по таймауту — поздний кадр не сохраняем, он был бы не в ряду с остальными.
+            return None
 
-            try:
-                result = await asyncio.to_thread(
-                    uploader.upload_jpeg_bytes,
-                    jpeg,
-                    filename,
-                )
-                print(f"[camera-capture] uploaded {filename}: {result}")
+        filename = f"rack_{rack_id}_{stamp}.jpg"
 
-            except Exception as e:
-                self._reset_uploader()
-                self._save_pending_file(jpeg, filename, f"upload failed: {e}")
+        # Всегда сохраняем локальную копию для таймлапсов.
+        # Она будет храниться local_archive_days дней и потом удалится автоматически.
+        self._save_archive_file(jpeg, filename, rack_id, taken_at)
 
+        return rack_id, filename, jpeg
 
 
-camera_capture_service = CameraCaptureService()
\ No newline at end of file
+camera_capture_service = CameraCaptureService()
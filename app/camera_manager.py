@@ -1,3 +1,4 @@
+import asyncio
 import threading
 import time
 import subprocess
@@ -8,11 +9,128 @@ import cv2
 import numpy as np
 
 
+# Без зрителей камера не читает кадры непрерывно: раз в IDLE_FRAME_INTERVAL_SEC, пока кадры
+# кто-то запрашивает (съёмка для архива), а через IDLE_RELEASE_SEC без запросов устройство закрывается.
+IDLE_FRAME_INTERVAL_SEC = 2.0
+IDLE_RELEASE_SEC = 60.0
+# После открытия устройства первые кадры тёмные (автоэкспозиция ещё не сошлась) — пропускаем их.
+WARMUP_FRAMES = 10
+# Сколько кадров может лежать в очереди V4L2: перед редким чтением выбрасываем их без декодирования.
+STALE_BUFFERS = 4
+
+# MJPG-камера отдаёт готовый JPEG. Без поворота/перспективы он уходит клиенту как есть,
+# а декодируется только когда нужны пиксели. Если драйвер не отдаёт сырой буфер — обычный режим.
+MJPEG_PASSTHROUGH = True
+
+# Карты remap в фиксированной точке (CV_16SC2): вдвое меньше памяти и быстрее на ARM,
+# точность 1/32 пикселя — та же, что у warpPerspective внутри.
+WARP_FIXED_POINT = True
+
+
+@dataclass
+class WarpPlan:
+    """Готовые карты remap: поворот/зеркало + перспектива за один проход."""
+    map1: Any
+    map2: Any
+    size: tuple[int, int]
+
+    def apply(self, frame: Any) -> Any:
+        return cv2.remap(frame, self.map1, self.map2, interpolation=cv2.INTER_LINEAR)
+
+
+def build_warp_plan(
+        frame_shape: tuple,
+        flip_vertical: bool,
+        flip_horizontal: bool,
+        points: list[float],
+        fixed_point: bool = WARP_FIXED_POINT,
+) -> Optional[WarpPlan]:
+    """
+    Строит карты для remap: для каждого пикселя результата — координата в исходном кадре.
+    Точки перспективы задаются на изображении ПОСЛЕ поворота, поэтому итоговое
+    преобразование = обратная перспектива, затем обратный поворот (он сам себе обратный).
+    """
+    h, w = frame_shape[:2]
+
+    src = np.float32([
+        [points[0], points[1]],  # левый верхний
+        [points[2], points[3]],  # правый верхний
+        [points[4], points[5]],  # правый нижний
+        [points[6], points[7]],  # левый нижний
+    ])
+
+    # Итоговый размер считаем по выбранной трапеции, а не по размеру всего кадра.
+    # Иначе область растягивается на 1280x720 и перспектива выглядит неестественно.
+    width_top = np.linalg.norm(src[1] - src[0])
+    width_bottom = np.linalg.norm(src[2] - src[3])
+    max_width = int(round(max(width_top, width_bottom)))
+
+    height_right = np.linalg.norm(src[2] - src[1])
+    height_left = np.linalg.norm(src[3] - src[0])
+    max_height = int(round(max(height_left, height_right)))
+
+    if max_width < 2 or max_height < 2:
+        return None
+
+    dst = np.float32([
+        [0, 0],
+        [max_width - 1, 0],
+        [max_width - 1, max_height - 1],
+        [0, max_height - 1],
+    ])
+
+    matrix = cv2.getPerspectiveTransform(src, dst)
+
+    flip = np.eye(3)
+    if flip_horizontal:
+        flip[0, 0], flip[0, 2] = -1, w - 1
+    if flip_vertical:
+        flip[1, 1], flip[1, 2] = -1, h - 1
+
+    # результат -> кадр после поворота -> исходный кадр
+    inverse = flip @ np.linalg.inv(matrix)
+
+    xs, ys = np.meshgrid(np.arange(max_width, dtype=np.float64), np.arange(max_height, dtype=np.float64))
+    sx = inverse[0, 0] * xs + inverse[0, 1] * ys + inverse[0, 2]
+    sy = inverse[1, 0] * xs + inverse[1, 1] * ys + inverse[1, 2]
+    sz = inverse[2, 0] * xs + inverse[2, 1] * ys + inverse[2, 2]
+
+    map_x = (sx / sz).astype(np.float32)
+    map_y = (sy / sz).astype(np.float32)
+
+    if fixed_point:
+        map1, map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+    else:
+        map1, map2 = map_x, map_y
+
+    return WarpPlan(map1=map1, map2=map2, size=(max_width, max_height))
+
+
 @dataclass
 class CameraFrame:
     frame: Optional[Any] = None
     last_error: Optional[str] = None
     updated_at: float = 0.0
+    # time.time() получения последнего кадра (updated_at меняется и при ошибке)
+    captured_at: float = 0.0
+    # номер кадра: растёт на 1 с каждым новым кадром с камеры
+    seq: int = 0
+    # сырой JPEG с камеры (режим MJPEG_PASSTHROUGH); frame тогда заполняется только при декодировании
+    jpeg: Optional[bytes] = None
+
+    def has_frame(self) -> bool:
+        return self.frame is not None or self.jpeg is not None
+
+
+def _raw_jpeg(frame: Any) -> Optional[bytes]:
+    """Сырой MJPG-буфер из cap.read() при CAP_PROP_CONVERT_RGB=0: одна строка байт, начинается с FFD8."""
+    if frame is None or frame.dtype != np.uint8:
+        return None
+    if frame.ndim == 1 or (frame.ndim == 2 and frame.shape[0] == 1):
+        data = frame.reshape(-1)
+        if data.size > 2 and data[0] == 0xFF and data[1] == 0xD8:
+            return data.tobytes()
+    return None
 
 
 class CameraWorker:
@@ -37,10 +155,30 @@ class CameraWorker:
 
         self.frame = CameraFrame()
         self.lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.lock)
         self.stop_event = threading.Event()
+
+        # Зрители живого потока (acquire/release). Пока их нет — кадры только по запросу.
+        self._subscribers = 0
+        self._demand_at = 0.0
+        self._wake = threading.Event()
         self.thread: Optional[threading.Thread] = None
         self.cap = None
 
+        # Готовый JPEG на вариант обработки: (flip_v, flip_h, warp_points | None, quality) -> (seq, bytes).
+        # Все клиенты потока и захват для архива берут одни и те же байты — кадр кодируется один раз.
+        self._encoded: dict[tuple, tuple[int, bytes]] = {}
+        self._encode_lock = threading.Lock()
+
+        # Карты remap считаются один раз на (размер кадра, поворот, точки) и живут,
+        # пока не поменяются warp_points. Доступ — под _encode_lock.
+        self._warp_plans: dict[tuple, Optional[WarpPlan]] = {}
+
+        # Асинхронные потоки ждут новый кадр на future в event loop. Поток камеры будит их
+        # одним call_soon_threadsafe на кадр — сколько бы зрителей ни было.
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._frame_waiters: set[asyncio.Future] = set()
+
     def update_settings(
             self,
             frame_width: int = 1280,
@@ -89,8 +227,44 @@ class CameraWorker:
         self.stop()
         self.start()
 
+    def acquire(self):
+        """Зритель живого потока подключился: камера работает на полной частоте."""
+        with self.lock:
+            self._subscribers += 1
+        self._wake.set()
+
+    def release(self):
+        with self.lock:
+            self._subscribers = max(0, self._subscribers - 1)
+            self._demand_at = time.time()
+
+    @property
+    def subscribers(self) -> int:
+        with self.lock:
+            return self._subscribers
+
+    def _wanted(self) -> bool:
+        with self.lock:
+            return self._subscribers > 0 or time.time() - self._demand_at < IDLE_RELEASE_SEC
+
+    def wait_fresh_frame(self, max_age_sec: float, timeout: float = 5.0) -> bool:
+        """
+        Для разовых снимков: если кадр старше max_age_sec (или камера закрыта),
+        будит поток камеры и ждёт новый кадр. Блокирует вызывающий поток — не звать из event loop.
+        """
+        with self.lock:
+            self._demand_at = time.time()
+            if self.frame.has_frame() and time.time() - self.frame.captured_at <= max_age_sec:
+                return True
+            seq = self.frame.seq
+
+        self._wake.set()
+        with self.frame_ready:
+            return self.frame_ready.wait_for(lambda: self.frame.seq != seq, timeout=timeout)
+
     def stop(self):
         self.stop_event.set()
+        self._wake.set()
 
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=2)
@@ -157,8 +331,32 @@ class CameraWorker:
                 f"white_balance_temperature={int(white_balance_temperature)}"
             )
 
+    def _publish(self, frame: Any):
+        raw = _raw_jpeg(frame)
+        with self.lock:
+            self.frame.frame = None if raw is not None else frame
+            self.frame.jpeg = raw
+            self.frame.last_error = None
+            self.frame.updated_at = self.frame.captured_at = time.time()
+            self.frame.seq += 1
+            self.frame_ready.notify_all()
+            loop = self._loop if self._frame_waiters else None
+
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._wake_frame_waiters)
+            except RuntimeError:
+                # event loop уже закрыт (остановка приложения)
+                pass
+
     def _run(self):
         while not self.stop_event.is_set():
+            if not self._wanted():
+                # Никто не смотрит и не просит кадров — устройство закрыто, ждём запроса.
+                self._wake.wait(timeout=5)
+                self._wake.clear()
+                continue
+
             try:
                 self.cap = cv2.VideoCapture(self.device, cv2.CAP_V4L2)
 
@@ -189,12 +387,41 @@ class CameraWorker:
                     for i in range(4)
                 )
 
+                passthrough = MJPEG_PASSTHROUGH and actual_fourcc_text == "MJPG"
+                if passthrough:
+                    # cap.read() вернёт сжатый кадр без декодирования (если драйвер это умеет).
+                    self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+
                 print(
                     f"[camera-manager] {self.device} requested={width}x{height}, "
-                    f"actual={actual_width}x{actual_height}, fourcc={actual_fourcc_text}"
+                    f"actual={actual_width}x{actual_height}, fourcc={actual_fourcc_text}, "
+                    f"passthrough={passthrough}"
                 )
 
+                # grab() только забирает буфер, без декодирования
+                for _ in range(WARMUP_FRAMES):
+                    self.cap.grab()
+
+                # Устройство открыли ради запроса кадра — первый кадр отдаём сразу, без ожидания.
+                first = True
+
                 while not self.stop_event.is_set():
+                    if self.subscribers == 0 and not first:
+                        if not self._wanted():
+                            print(f"[camera-manager] {self.device} idle, releasing device")
+                            break
+
+                        # Редкий режим: ждём интервал (или запрос свежего кадра),
+                        # выбрасываем устаревшие буферы и декодируем один кадр.
+                        self._wake.wait(timeout=IDLE_FRAME_INTERVAL_SEC)
+                        self._wake.clear()
+                        if self.stop_event.is_set():
+                            break
+                        if self.subscribers == 0:
+                            for _ in range(STALE_BUFFERS):
+                                self.cap.grab()
+
+                    first = False
                     ok, frame = self.cap.read()
 
                     if not ok:
@@ -202,12 +429,10 @@ class CameraWorker:
                         time.sleep(0.3)
                         continue
 
-                    with self.lock:
-                        self.frame.frame = frame
-                        self.frame.last_error = None
-                        self.frame.updated_at = time.time()
+                    self._publish(frame)
 
-                    time.sleep(0.05)
+                    if self.subscribers > 0:
+                        time.sleep(0.05)
 
             except Exception as e:
                 self._set_error(str(e))
@@ -225,75 +450,205 @@ class CameraWorker:
         flip_horizontal: bool = False,
         warp_enabled: bool = False,
         warp_points: Optional[list[float]] = None,
+        max_age_sec: Optional[float] = None,
     ) -> Optional[bytes]:
-        with self.lock:
-            if self.frame.frame is None:
-                return None
-            frame = self.frame.frame.copy()
-
-        # Сначала поворот/зеркало. Точки перспективы задаются уже для изображения после поворота.
-        if flip_vertical and flip_horizontal:
-            frame = cv2.flip(frame, -1)
-        elif flip_vertical:
-            frame = cv2.flip(frame, 0)
-        elif flip_horizontal:
-            frame = cv2.flip(frame, 1)
-
-        frame = self._apply_perspective_warp(frame, warp_enabled, warp_points)
-
-        ok, jpg = cv2.imencode(
-            ".jpg",
-            frame,
-            [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality],
+        _, jpeg = self.get_encoded(
+            jpeg_quality=jpeg_quality,
+            flip_vertical=flip_vertical,
+            flip_horizontal=flip_horizontal,
+            warp_enabled=warp_enabled,
+            warp_points=warp_points,
+            max_age_sec=max_age_sec,
         )
+        return jpeg
 
-        if not ok:
-            self._set_error(f"Не удалось закодировать кадр с {self.device}")
-            return None
-
-        return jpg.tobytes()
+    @staticmethod
+    def _variant_key(
+        jpeg_quality: int,
+        flip_vertical: bool,
+        flip_horizontal: bool,
+        warp_enabled: bool,
+        warp_points: Optional[list[float]],
+    ) -> tuple[bool, tuple]:
+        use_warp = bool(warp_enabled and warp_points and len(warp_points) == 8)
+        key = (
+            bool(flip_vertical),
+            bool(flip_horizontal),
+            tuple(float(p) for p in warp_points) if use_warp else None,
+            int(jpeg_quality),
+        )
+        return use_warp, key
 
+    def _is_passthrough(self, key: tuple) -> bool:
+        # key = (flip_v, flip_h, warp, quality); вызывать под self.lock
+        return self.frame.jpeg is not None and not key[0] and not key[1] and key[2] is None
 
-    @staticmethod
-    def _apply_perspective_warp(frame: Any, enabled: bool, points: Optional[list[float]]) -> Any:
-        if not enabled or not points or len(points) != 8:
-            return frame
+    def peek_encoded(
+        self,
+        jpeg_quality: int = 90,
+        flip_vertical: bool = False,
+        flip_horizontal: bool = False,
+        warp_enabled: bool = False,
+        warp_points: Optional[list[float]] = None,
+    ) -> Optional[tuple[int, Optional[bytes]]]:
+        """Как get_encoded, но без кодирования: None, если для текущего кадра JPEG ещё не готов."""
+        _, key = self._variant_key(jpeg_quality, flip_vertical, flip_horizontal, warp_enabled, warp_points)
+        with self.lock:
+            if not self.frame.has_frame():
+                return self.frame.seq, None
+            if self._is_passthrough(key):
+                return self.frame.seq, self.frame.jpeg
+            cached = self._encoded.get(key)
+            if cached and cached[0] == self.frame.seq:
+                return cached
+        return None
+
+    async def get_encoded_async(self, **kwargs) -> tuple[int, Optional[bytes]]:
+        """Для event loop: готовый JPEG берём сразу, кодирование — в отдельном потоке."""
+        cached = self.peek_encoded(**kwargs)
+        if cached is not None:
+            return cached
+        return await asyncio.to_thread(self.get_encoded, **kwargs)
+
+    async def wait_frame(self, after_seq: Optional[int], timeout: float = 1.0):
+        """
+        Ждёт кадр новее after_seq (или timeout). Без опроса: будит поток камеры.
+        Пока кадра нет совсем (камера не открылась или прогревается) — всегда ждёт.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.frame.seq != after_seq and self.frame.has_frame():
+                return
+            self._loop = loop
+            fut = loop.create_future()
+            self._frame_waiters.add(fut)
 
         try:
-            src = np.float32([
-                [points[0], points[1]],  # левый верхний
-                [points[2], points[3]],  # правый верхний
-                [points[4], points[5]],  # правый нижний
-                [points[6], points[7]],  # левый нижний
-            ])
-
-            # Итоговый размер считаем по выбранной трапеции, а не по размеру всего кадра.
-            # Иначе область растягивается на 1280x720 и перспектива выглядит неестественно.
-            width_top = np.linalg.norm(src[1] - src[0])
-            width_bottom = np.linalg.norm(src[2] - src[3])
-            max_width = int(round(max(width_top, width_bottom)))
-
-            height_right = np.linalg.norm(src[2] - src[1])
-            height_left = np.linalg.norm(src[3] - src[0])
-            max_height = int(round(max(height_left, height_right)))
-
-            if max_width < 2 or max_height < 2:
-                return frame
-
-            dst = np.float32([
-                [0, 0],
-                [max_width - 1, 0],
-                [max_width - 1, max_height - 1],
-                [0, max_height - 1],
-            ])
-
-            matrix = cv2.getPerspectiveTransform(src, dst)
-            return cv2.warpPerspective(frame, matrix, (max_width, max_height))
+            await asyncio.wait_for(fut, timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.lock:
+                self._frame_waiters.discard(fut)
+
+    def _wake_frame_waiters(self):
+        # Выполняется в event loop.
+        with self.lock:
+            waiters, self._frame_waiters = self._frame_waiters, set()
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
 
-        except Exception as e:
-            print(f"[camera-manager] perspective warp error: {e}")
+    def get_encoded(
+        self,
+        jpeg_quality: int = 90,
+        flip_vertical: bool = False,
+        flip_horizontal: bool = False,
+        warp_enabled: bool = False,
+        warp_points: Optional[list[float]] = None,
+        max_age_sec: Optional[float] = None,
+    ) -> tuple[int, Optional[bytes]]:
+        """
+        Текущий кадр в JPEG и его номер (seq). Для каждого варианта обработки кадр
+        кодируется один раз, остальные вызовы с тем же seq получают готовые байты.
+        max_age_sec — сначала дождаться кадра не старше этого (см. wait_fresh_frame).
+        """
+        if max_age_sec is not None:
+            self.wait_fresh_frame(max_age_sec)
+
+        use_warp, key = self._variant_key(jpeg_quality, flip_vertical, flip_horizontal, warp_enabled, warp_points)
+
+        with self.lock:
+            if not self.frame.has_frame():
+                return self.frame.seq, None
+            seq = self.frame.seq
+            if self._is_passthrough(key):
+                # Без обработки — JPEG с камеры как есть (jpeg_quality к нему не применяется).
+                return seq, self.frame.jpeg
+            cached = self._encoded.get(key)
+            if cached and cached[0] == seq:
+                return cached
+            frame = self.frame.frame
+            raw = self.frame.jpeg
+
+        # Один кодировщик на камеру: второй клиент дождётся первого и возьмёт его результат.
+        with self._encode_lock:
+            with self.lock:
+                cached = self._encoded.get(key)
+                if cached and cached[0] == seq:
+                    return cached
+
+            if frame is None:
+                # Пиксели понадобились впервые для этого кадра — декодируем один раз,
+                # остальные варианты обработки возьмут уже декодированный.
+                frame = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+                if frame is None:
+                    self._set_error(f"Не удалось декодировать кадр с {self.device}")
+                    return seq, None
+                with self.lock:
+                    if self.frame.seq == seq:
+                        self.frame.frame = frame
+
+            frame = self._transform(frame, flip_vertical, flip_horizontal, key[2] if use_warp else None)
+
+            ok, jpg = cv2.imencode(
+                ".jpg",
+                frame,
+                [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality],
+            )
+
+            if not ok:
+                self._set_error(f"Не удалось закодировать кадр с {self.device}")
+                return seq, None
+
+            result = (seq, jpg.tobytes())
+            with self.lock:
+                # Кодированные версии старых кадров больше никому не нужны.
+                self._encoded = {k: v for k, v in self._encoded.items() if v[0] == seq}
+                self._encoded[key] = result
+
+        return result
+
+
+    def _transform(
+        self,
+        frame: Any,
+        flip_vertical: bool,
+        flip_horizontal: bool,
+        warp_points: Optional[tuple],
+    ) -> Any:
+        """
+        Поворот/зеркало и перспектива. cv2.flip/remap создают новый массив,
+        исходный кадр не меняется — копировать его не нужно.
+        """
+        if warp_points is None:
+            # Только поворот — cv2.flip быстрее remap.
+            if flip_vertical and flip_horizontal:
+                return cv2.flip(frame, -1)
+            if flip_vertical:
+                return cv2.flip(frame, 0)
+            if flip_horizontal:
+                return cv2.flip(frame, 1)
             return frame
-        
+
+        plan_key = (frame.shape, bool(flip_vertical), bool(flip_horizontal), warp_points)
+        if plan_key not in self._warp_plans:
+            try:
+                plan = build_warp_plan(frame.shape, flip_vertical, flip_horizontal, list(warp_points))
+            except Exception as e:
+                print(f"[camera-manager] perspective warp error: {e}")
+                plan = None
+            if len(self._warp_plans) >= 8:
+                # точки меняли много раз — старые планы больше не нужны
+                self._warp_plans.clear()
+            self._warp_plans[plan_key] = plan
+
+        plan = self._warp_plans[plan_key]
+        if plan is None:
+            # Неудачные точки: как раньше, показываем кадр без перспективы.
+            return self._transform(frame, flip_vertical, flip_horizontal, None)
+        return plan.apply(frame)
+
     def get_error(self) -> Optional[str]:
         with self.lock:
             return self.frame.last_error
@@ -340,7 +695,11 @@ class CameraManager:
 
             return worker
 
-    def get_jpeg(
+    def get_jpeg(self, device: str, **kwargs) -> Optional[bytes]:
+        _, jpeg = self.get_encoded(device, **kwargs)
+        return jpeg
+
+    def get_encoded(
             self,
             device: str,
             jpeg_quality: int = 90,
@@ -354,7 +713,8 @@ class CameraManager:
             focus_absolute: Optional[int] = None,
             white_balance_auto: bool = True,
             white_balance_temperature: Optional[int] = None,
-    ) -> Optional[bytes]:
+            max_age_sec: Optional[float] = None,
+    ) -> tuple[int, Optional[bytes]]:
         worker = self.get_worker(
             device=device,
             frame_width=frame_width,
@@ -364,12 +724,13 @@ class CameraManager:
             white_balance_auto=white_balance_auto,
             white_balance_temperature=white_balance_temperature,
         )
-        return worker.get_jpeg(
+        return worker.get_encoded(
             jpeg_quality=jpeg_quality,
             flip_vertical=flip_vertical,
             flip_horizontal=flip_horizontal,
             warp_enabled=warp_enabled,
             warp_points=warp_points,
+            max_age_sec=max_age_sec,
         )
 
     def get_error(self, device: str) -> Optional[str]:
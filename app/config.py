@@ -2,6 +2,20 @@ from pydantic import BaseModel
 
 class Settings(BaseModel):
     db_url: str = "sqlite+aiosqlite:///./kisamore.db"
-    scheduler_tick_seconds: int = 2
+    # PRAGMA synchronous для SQLite в режиме WAL: NORMAL бережёт SD-карту, FULL — fsync на каждый коммит
+    sqlite_synchronous: str = "NORMAL"
+    # Планировщик спит до ближайшего фронта расписания, но не дольше этого
+    scheduler_max_sleep_seconds: int = 60
+    # После ошибки прохода (например, реле не ответило) — повтор через столько секунд
+    scheduler_retry_seconds: float = 2.0
+    # Через сколько секунд после изменения состояние полок записывается в БД (пачкой)
+    state_flush_delay_seconds: float = 1.0
+    # История датчиков копится в памяти и пишется одной пачкой: раз в N секунд или по N строк
+    history_flush_interval_seconds: int = 300
+    history_flush_max_rows: int = 500
+    # Сколько дней хранить сырую историю и минутные агрегаты (0 — не удалять).
+    # 15-минутные и часовые агрегаты хранятся всегда.
+    history_raw_retention_days: int = 90
+    history_minute_rollup_retention_days: int = 90
 
 settings = Settings()
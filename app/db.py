@@ -1,5 +1,30 @@
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from .config import settings
 
 engine = create_async_engine(settings.db_url, echo=False)
 SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+
+IS_SQLITE = settings.db_url.startswith("sqlite")
+
+
+if IS_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        # WAL: запись дописывается в журнал, читатели не блокируют писателя.
+        # synchronous=NORMAL в WAL не делает fsync на каждый коммит (только на checkpoint) —
+        # база остаётся целой при выключении питания, теряются максимум последние транзакции.
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cur.execute("PRAGMA busy_timeout=5000")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.close()
+
+
+async def checkpoint():
+    """Переносит WAL в основной файл с fsync. Вызывается при остановке, после всех финальных записей."""
+    if not IS_SQLITE:
+        return
+    async with engine.connect() as conn:
+        await conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
@@ -1,7 +1,9 @@
 import io
 import os
+import threading
+from typing import Optional
 
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import AuthorizedSession, Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
@@ -10,6 +12,16 @@ from googleapiclient.http import MediaIoBaseUpload
 
 SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 
+# Файлы больше этого грузятся resumable-сессией кусками RESUMABLE_CHUNK_SIZE
+# (кратно 256 КБ — требование Drive API).
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+RESUMABLE_CHUNK_SIZE = 4 * 1024 * 1024
+RESUMABLE_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files?uploadType=resumable&fields=id,name"
+
+# Несколько загрузчиков работают параллельно, а авторизация у них общая (token_file,
+# локальный сервер на порту 8090) — получаем/обновляем токен по очереди.
+_credentials_lock = threading.Lock()
+
 
 class GoogleDriveUploader:
     def __init__(self, credentials_file: str, folder_id: str, token_file: str):
@@ -17,8 +29,18 @@ class GoogleDriveUploader:
         self.folder_id = folder_id
         self.token_file = token_file
         self.service = None
+        self.http: Optional[AuthorizedSession] = None
+
+    def reset(self):
+        """После сетевой ошибки: клиенты будут созданы заново при следующей загрузке."""
+        self.service = None
+        self.http = None
 
     def _get_credentials(self):
+        with _credentials_lock:
+            return self._load_credentials()
+
+    def _load_credentials(self):
         creds = None
 
         if os.path.exists(self.token_file):
@@ -52,6 +74,11 @@ class GoogleDriveUploader:
         self.service = build("drive", "v3", credentials=creds)
         return self.service
 
+    def _get_http(self) -> AuthorizedSession:
+        if self.http is None:
+            self.http = AuthorizedSession(self._get_credentials())
+        return self.http
+
     def upload_jpeg_bytes(self, jpeg_bytes: bytes, filename: str):
         service = self._get_service()
 
@@ -70,4 +97,69 @@ class GoogleDriveUploader:
             body=body,
             media_body=media,
             fields="id,name",
-        ).execute()
\ No newline at end of file
+        ).execute()
+
+    def upload_file(self, path: str, filename: str, session: Optional[dict] = None):
+        """
+        Загружает файл с диска. Большие файлы — resumable-сессией: её адрес пишется
+        в session["uri"], и если загрузка прервётся, следующий вызов с тем же session
+        продолжит с места обрыва, а не начнёт заново.
+        """
+        size = os.path.getsize(path)
+        if size <= RESUMABLE_THRESHOLD:
+            with open(path, "rb") as f:
+                return self.upload_jpeg_bytes(f.read(), filename)
+
+        session = session if session is not None else {}
+        http = self._get_http()
+
+        offset = 0
+        if session.get("uri"):
+            # Продолжение сессии: сначала спрашиваем у Drive, сколько байт уже принято.
+            resp = http.put(session["uri"], headers={"Content-Range": f"bytes */{size}"}, allow_redirects=False)
+            if resp.status_code in (200, 201):
+                session["uri"] = None
+                return resp.json()
+            if resp.status_code in (404, 410):
+                # Сессия истекла (живёт около недели) — начнём загрузку заново.
+                session["uri"] = None
+            elif resp.status_code == 308:
+                offset = self._received(resp)
+            else:
+                resp.raise_for_status()
+
+        if not session.get("uri"):
+            resp = http.post(
+                RESUMABLE_UPLOAD_URL,
+                json={"name": filename, "parents": [self.folder_id]},
+                headers={"X-Upload-Content-Type": "image/jpeg", "X-Upload-Content-Length": str(size)},
+            )
+            resp.raise_for_status()
+            session["uri"] = resp.headers["Location"]
+
+        with open(path, "rb") as f:
+            while True:
+                f.seek(offset)
+                chunk = f.read(RESUMABLE_CHUNK_SIZE)
+                resp = http.put(
+                    session["uri"],
+                    data=chunk,
+                    headers={"Content-Range": f"bytes {offset}-{offset + len(chunk) - 1}/{size}"},
+                    allow_redirects=False,
+                )
+                if resp.status_code in (200, 201):
+                    session["uri"] = None
+                    return resp.json()
+                if resp.status_code != 308:
+                    # Адрес сессии остаётся в session: следующая попытка продолжит с принятого.
+                    resp.raise_for_status()
+                    raise RuntimeError(f"unexpected status {resp.status_code} from Google Drive upload")
+                offset = self._received(resp)
+
+    @staticmethod
+    def _received(resp) -> int:
+        # 308 Resume Incomplete: Range "bytes=0-N" — принято N+1 байт; без Range — ничего.
+        received = resp.headers.get("Range")
+        if not received:
+            return 0
+        return int(received.rsplit("-", 1)[1]) + 1
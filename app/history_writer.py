@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any
+
+from sqlalchemy import insert
+
+from .config import settings
+from .db import SessionLocal
+from .models import RackSensorHistory
+from .sensor_rollup import prune, upsert_rollups
+
+# Чистка старой истории — не чаще раза в час
+_PRUNE_EVERY_SEC = 3600
+
+
+class HistoryWriter:
+    """
+    Буфер истории датчиков. Сэмплы копятся в памяти и уходят в БД одним
+    INSERT ... executemany в одной транзакции — раз в flush_interval_sec
+    или как только набралось max_rows строк. На SD-карте это один коммит
+    вместо коммита на каждый опрос. В той же транзакции обновляются агрегаты
+    (sensor_rollup), а раз в час удаляется история старше срока хранения.
+    """
+
+    def __init__(self, flush_interval_sec: float = 300, max_rows: int = 500):
+        self.flush_interval_sec = flush_interval_sec
+        self.max_rows = max_rows
+        self._buffer: list[dict[str, Any]] = []
+        self._oldest_at = 0.0
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._running = False
+        self._last_prune = 0.0
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def add(self, rows: list[dict[str, Any]]):
+        """rows — словари с полями RackSensorHistory (rack_id, sensor_slave_id, soil_*, created_at)."""
+        if not rows:
+            return
+        if not self._buffer:
+            self._oldest_at = time.monotonic()
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.max_rows:
+            self._full.set()
+
+    async def _loop(self):
+        while self._running:
+            timeout = self.flush_interval_sec
+            if self._buffer:
+                timeout = max(0.0, self._oldest_at + self.flush_interval_sec - time.monotonic())
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[history_writer] flush error: {e}")
+                await asyncio.sleep(10)
+                continue
+
+            if time.monotonic() - self._last_prune >= _PRUNE_EVERY_SEC:
+                self._last_prune = time.monotonic()
+                try:
+                    await prune()
+                except Exception as e:
+                    print(f"[history_writer] prune error: {e}")
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+
+            try:
+                async with SessionLocal() as s:
+                    await s.execute(insert(RackSensorHistory), batch)
+                    await upsert_rollups(s, batch)
+                    await s.commit()
+            except Exception:
+                # Вернём строки в начало буфера, чтобы не потерять и не перепутать порядок.
+                self._buffer = batch + self._buffer
+                self._oldest_at = time.monotonic()
+                raise
+
+
+history_writer = HistoryWriter(
+    flush_interval_sec=settings.history_flush_interval_seconds,
+    max_rows=settings.history_flush_max_rows,
+)
@@ -23,15 +23,29 @@ class CameraCaptureConfig(BaseModel):
     # Делать фото только если на полке включён свет
     only_when_light_on: bool = True
 
+    # Снимки со всех камер делаются одновременно: не больше max_parallel камер сразу,
+    # камеры, не отдавшие кадр за capture_timeout_seconds, в этом цикле пропускаются.
+    max_parallel: int = Field(default=4, ge=1, le=16)
+    capture_timeout_seconds: int = Field(default=15, ge=1, le=120)
+
     # Локальная очередь фото, которые не удалось загрузить в Google Drive.
     # После успешной загрузки файл из этой папки удаляется.
     pending_dir: str = "data/camera_pending"
 
+    # Отправка очереди работает отдельно от съёмки: upload_concurrency загрузок одновременно,
+    # проверка очереди не реже раза в upload_interval_seconds, пауза после ошибок
+    # растёт вдвое до upload_retry_max_seconds.
+    upload_concurrency: int = Field(default=2, ge=1, le=8)
+    upload_interval_seconds: int = Field(default=30, ge=5, le=3600)
+    upload_retry_max_seconds: int = Field(default=900, ge=10, le=86400)
+
     # Локальное хранение всех снимков для таймлапсов.
     # Фото всегда сохраняются сюда, даже если загрузка в Google Drive прошла успешно.
     local_archive_enabled: bool = True
     local_archive_dir: str = "data/camera_archive"
     local_archive_days: int = Field(default=60, ge=1, le=365)
+    # Ограничение размера архива (ГБ). При превышении удаляются самые старые дни.
+    local_archive_max_gb: Optional[float] = Field(default=None, gt=0, le=4096)
 
 class CameraHW(BaseModel):
     name: str = Field(default="", max_length=100)
@@ -76,6 +90,21 @@ class RS485Settings(BaseModel):
     slave_id: int = Field(default=1, ge=1, le=247)
     coil_base: int = Field(default=0, ge=0, le=1)   # 0 или 1
     timeout: float = Field(default=1.0, ge=0.1, le=10.0)
+    # Групповая запись реле одной командой (FC16). Если плата не поддерживает —
+    # драйвер сам перейдёт на запись по одному каналу.
+    bulk_write: bool = True
+    # asyncio — собственный Modbus RTU транспорт на event loop (без потоков);
+    # minimalmodbus — прежняя реализация в отдельном потоке (запасной вариант).
+    transport: Literal["asyncio", "minimalmodbus"] = "asyncio"
+    # Пауза между кадрами на шине, мс. Пусто — 3.5 символа по скорости порта
+    # (≈4 мс на 9600, <1 мс на 115200). Подбирается POST /api/rs485/calibrate.
+    relay_write_gap_ms: Optional[float] = Field(default=None, ge=0, le=1000)
+    # Сколько устройство думает перед ответом, мс. Раньше окна «запрос + ответ + это время»
+    # чтение датчика не прерывается командой реле, а после прерывания шина молчит до его конца.
+    device_turnaround_ms: float = Field(default=50, ge=0, le=1000)
+    # Период сверки реле с платой (чтение состояния и исправление расхождений), сек.
+    # 0 — сверка выключена.
+    verify_interval_sec: int = Field(default=0, ge=0, le=86400)
 
 
 class HWConfig(BaseModel):
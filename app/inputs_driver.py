@@ -1,6 +1,9 @@
 from __future__ import annotations
 
-from typing import Dict
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+import threading
 import time
 
 try:
@@ -16,10 +19,18 @@ if GPIO is None:
         def setmode(self, *args, **kwargs): pass
         def setup(self, *args, **kwargs): pass
         def input(self, *args, **kwargs): return 0
-        def cleanup(self): pass
+        def cleanup(self, *args, **kwargs): pass
 
     GPIO = MockGPIO()
 
+
+@dataclass(frozen=True)
+class InputState:
+    active: bool
+    # time.time() момента, когда установилось это состояние (после антидребезга)
+    changed_at: float
+
+
 class InputsDriver:
     """
     Датчики уровня = сухой контакт между GPIO и GND.
@@ -27,33 +38,112 @@ class InputsDriver:
       - разомкнут => 1
       - замкнут   => 0
     snapshot() возвращает True, когда датчик СРАБОТАЛ (контакт замкнут).
+
+    Пины опрашивает отдельный поток, а snapshot()/states() отдают готовое состояние
+    из памяти — запросы API и event loop никогда не ждут антидребезг.
     """
 
-    def __init__(self, name_to_gpio: Dict[str, int], debounce_s: float = 0.05):
+    def __init__(
+        self,
+        name_to_gpio: Dict[str, int],
+        debounce_s: float = 0.05,
+        sample_interval_s: float = 0.02,
+        on_change: Optional[Callable[[str, bool], None]] = None,
+        events_size: int = 200,
+    ):
         self._pins: Dict[str, int] = {str(k): int(v) for k, v in (name_to_gpio or {}).items()}
         self._debounce_s = float(debounce_s)
+        self._sample_interval_s = float(sample_interval_s)
+        self._on_change = on_change
 
         GPIO.setmode(GPIO.BCM)
         for _, pin in self._pins.items():
             GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 
-    def _read_stable(self, pin: int) -> int:
-        """Простая антидребезг/антинаводка: 3 чтения подряд должны совпасть."""
-        a = GPIO.input(pin)
-        time.sleep(self._debounce_s)
-        b = GPIO.input(pin)
-        time.sleep(self._debounce_s)
-        c = GPIO.input(pin)
-        return a if (a == b == c) else c
+        self._lock = threading.Lock()
+        now = time.time()
+        # Стартовое состояние — одно чтение; дальше его уточняет фоновый поток.
+        self._states: Dict[str, InputState] = {
+            name: InputState(active=(GPIO.input(pin) == 0), changed_at=now)
+            for name, pin in self._pins.items()
+        }
+        # name -> (уровень-кандидат, time.monotonic() с которого он держится)
+        self._candidates: Dict[str, tuple[bool, float]] = {}
+        self._events: deque[dict] = deque(maxlen=events_size)
+        self._event_seq = 0
+        self.sampled_at = now
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if self._pins:
+            self._thread = threading.Thread(target=self._run, name="inputs-monitor", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """
+        Фоновый опрос пинов каждые sample_interval_s. Новый уровень принимается,
+        только если он продержался debounce_s без перерыва (антидребезг по времени).
+        """
+        while not self._stop.wait(self._sample_interval_s):
+            try:
+                self._sample()
+            except Exception as e:
+                print(f"[inputs] sample error: {e}")
+                self._stop.wait(1.0)
+
+    def _sample(self):
+        mono = time.monotonic()
+        changed = []
 
-    def snapshot(self) -> Dict[str, bool]:
-        out: Dict[str, bool] = {}
         for name, pin in self._pins.items():
-            v = self._read_stable(pin)
-            out[name] = (v == 0)  # замкнут на GND => сработал
-        return out
+            active = GPIO.input(pin) == 0  # замкнут на GND => сработал
+
+            if active == self._states[name].active:
+                self._candidates.pop(name, None)
+                continue
+
+            candidate = self._candidates.get(name)
+            if candidate is None or candidate[0] != active:
+                self._candidates[name] = (active, mono)
+            elif mono - candidate[1] >= self._debounce_s:
+                self._candidates.pop(name, None)
+                changed.append((name, active))
+
+        now = time.time()
+        with self._lock:
+            self.sampled_at = now
+            for name, active in changed:
+                self._states[name] = InputState(active=active, changed_at=now)
+                self._event_seq += 1
+                self._events.append({"seq": self._event_seq, "name": name, "active": active, "ts": now})
+
+        for name, active in changed:
+            print(f"[inputs] {name}: {'сработал' if active else 'не сработал'}")
+            if self._on_change:
+                try:
+                    self._on_change(name, active)
+                except Exception as e:
+                    print(f"[inputs] listener error: {e}")
+
+    def snapshot(self) -> Dict[str, bool]:
+        """Последнее устойчивое состояние из памяти — без обращения к GPIO и без ожидания."""
+        with self._lock:
+            return {name: st.active for name, st in self._states.items()}
+
+    def states(self) -> Dict[str, InputState]:
+        with self._lock:
+            return dict(self._states)
+
+    def events(self, after_seq: int = 0) -> list[dict]:
+        """Изменения состояния (последние events_size) с номером больше after_seq."""
+        with self._lock:
+            return [e for e in self._events if e["seq"] > after_seq]
 
     def close(self) -> None:
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
         # аккуратно освободить только наши пины
         for _, pin in self._pins.items():
             try:
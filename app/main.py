@@ -4,8 +4,11 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from . import runtime
+from .db import checkpoint
 from .bootstrap import ensure_db_tables, ensure_db_racks
 from .scheduler import Scheduler
+from .schedule_cache import schedule_cache
+from .rack_state_store import rack_state_store
 
 from .routes_state import router as state_router
 from .routes_manual import router as manual_router
@@ -13,10 +16,17 @@ from .routes_schedule import router as schedule_router
 from .routes_config import router as config_router
 from .routes_inputs import router as inputs_router
 from .routes_camera import router as camera_router
+from .routes_stream import router as stream_router
+from .routes_rs485 import router as rs485_router
 from .sensor_history_service import SensorHistoryService
+from .sensor_poller import sensor_poller
+from .history_writer import history_writer
+from .sensor_rollup import backfill_if_empty
 from .routes_sensor_history import router as sensor_history_router
 from .camera_capture_service import camera_capture_service
+from .upload_queue import upload_queue
 from .camera_manager import camera_manager
+from .state_broadcaster import state_broadcaster
 
 
 import subprocess
@@ -31,11 +41,14 @@ app.include_router(config_router)
 app.include_router(inputs_router)
 app.include_router(sensor_history_router)
 app.include_router(camera_router)
+app.include_router(stream_router)
+app.include_router(rs485_router)
 
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
 scheduler = Scheduler(runtime)
+runtime.scheduler = scheduler
 sensor_history_service = SensorHistoryService(interval_sec=60)  # раз в 1 минуту
 
 @app.on_event("startup")
@@ -46,6 +59,10 @@ async def on_startup():
     # 2) база
     await ensure_db_tables()
     await ensure_db_racks(runtime.cfg.racks_count if runtime.cfg else 4)
+    await backfill_if_empty()
+    await schedule_cache.load()
+    await rack_state_store.load()
+    await rack_state_store.start()
 
     # 2.5) FAIL-SAFE + восстановление состояния
     # Сначала выключаем всё (на случай залипаний), затем сразу же включаем то,
@@ -55,20 +72,35 @@ async def on_startup():
     # 3) планировщик
     await scheduler.start()
 
-    # 4) запись истории в БД
+    # 4) опрос датчиков почвы (единственный, кто читает их с шины) + запись истории в БД
+    await sensor_poller.start()
+    await history_writer.start()
     await sensor_history_service.start()
 
-    # 5) отправка фото с камер в Google Drive
+    # 4.5) push-обновления дашборда (/api/stream/state)
+    await state_broadcaster.start()
+
+    # 5) съёмка по расписанию + отдельная очередь отправки фото в Google Drive
+    await upload_queue.start()
     await camera_capture_service.start()
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    await state_broadcaster.stop()
     await camera_capture_service.stop()
+    await upload_queue.stop()
     camera_manager.stop_all()
 
     await scheduler.stop()
 
     await sensor_history_service.stop()
+    await history_writer.stop()
+    await sensor_poller.stop()
+
+    # Последним: дописываем в БД состояние полок, изменённое планировщиком/ручными командами,
+    # и переносим WAL в основной файл (fsync), чтобы всё это пережило выключение питания.
+    await rack_state_store.stop()
+    await checkpoint()
 
     if runtime.inputs:
         runtime.inputs.close()
@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import asyncio
+import struct
+import time
+from typing import Optional
+
+import serial
+
+# Ошибки — те же классы, что бросает minimalmodbus: драйвер и сервисы обрабатывают
+# их одинаково при любом транспорте.
+from minimalmodbus import (
+    IllegalRequestError,
+    InvalidResponseError,
+    NegativeAcknowledgeError,
+    NoResponseError,
+    SlaveDeviceBusyError,
+    SlaveReportedException,
+)
+
+
+def _make_crc_table() -> list[int]:
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC_TABLE = _make_crc_table()
+
+
+def crc16(data: bytes) -> int:
+    """CRC-16/MODBUS (полином 0xA001, начальное 0xFFFF). В кадре передаётся младшим байтом вперёд."""
+    crc = 0xFFFF
+    for b in data:
+        crc = (crc >> 8) ^ _CRC_TABLE[(crc ^ b) & 0xFF]
+    return crc
+
+
+def _with_crc(data: bytes) -> bytes:
+    return data + struct.pack("<H", crc16(data))
+
+
+def char_time(baudrate: int, bytesize: int = 8, parity: str = "N", stopbits: int = 1) -> float:
+    """Время передачи одного символа, сек: старт-бит + данные + чётность + стоп-биты."""
+    bits = 1 + int(bytesize) + (0 if (parity or "N").upper() == "N" else 1) + int(stopbits)
+    return bits / float(baudrate)
+
+
+def frame_gap(baudrate: int, bytesize: int = 8, parity: str = "N", stopbits: int = 1) -> float:
+    """
+    Минимальная тишина между кадрами Modbus RTU (t3.5).
+    Выше 19200 бод спецификация фиксирует 1.75 мс.
+    """
+    if baudrate > 19200:
+        return 0.00175
+    return 3.5 * char_time(baudrate, bytesize, parity, stopbits)
+
+
+# Коды исключений Modbus -> (класс, текст), как у minimalmodbus
+_SLAVE_ERRORS = {
+    1: (IllegalRequestError, "Slave reported illegal function"),
+    2: (IllegalRequestError, "Slave reported illegal data address"),
+    3: (IllegalRequestError, "Slave reported illegal data value"),
+    4: (SlaveReportedException, "Slave reported device failure"),
+    6: (SlaveDeviceBusyError, "Slave reported device busy"),
+    7: (NegativeAcknowledgeError, "Slave reported negative acknowledge"),
+    8: (SlaveReportedException, "Slave reported memory parity error"),
+    10: (SlaveReportedException, "Slave reported gateway path unavailable"),
+    11: (SlaveReportedException, "Slave reported gateway target device failed to respond"),
+}
+
+_PARITY = {"N": serial.PARITY_NONE, "E": serial.PARITY_EVEN, "O": serial.PARITY_ODD}
+
+
+class AsyncModbusRTU:
+    """
+    Modbus RTU мастер прямо на event loop: порт открыт в неблокирующем режиме,
+    ответ собирается в колбэке loop.add_reader, ожидание — обычный await.
+    Ни потоков, ни sleep на каждую транзакцию.
+
+    Тайминг кадров считается от скорости порта: перед каждым запросом выдерживается
+    тишина t3.5 после последней активности на шине, таймаут ответа = время передачи
+    запроса + timeout. Ответ проверяется по CRC, адресу и коду функции; исключения
+    slave-устройства превращаются в те же ошибки, что у minimalmodbus.
+
+    Если транзакцию отменили после отправки запроса, устройство всё равно может
+    ответить: шина остаётся в тишине до конца окна ответа (response_window),
+    чтобы запоздавший ответ не столкнулся со следующим кадром.
+
+    Работает на Linux (Raspberry Pi). На Windows add_reader для COM-портов нет —
+    там драйвер использует minimalmodbus.
+    """
+
+    def __init__(
+        self,
+        port: str,
+        baudrate: int = 9600,
+        parity: str = "N",
+        stopbits: int = 1,
+        bytesize: int = 8,
+        timeout: float = 1.0,
+        turnaround: float = 0.05,
+    ):
+        parity = (parity or "N").upper()
+        if parity not in _PARITY:
+            raise ValueError(f"Unsupported parity: {parity!r}. Use N/E/O.")
+
+        self.port = port
+        self.baudrate = int(baudrate)
+        self.parity = parity
+        self.stopbits = int(stopbits)
+        self.bytesize = int(bytesize)
+        self.timeout = float(timeout)
+        # Сколько устройство думает между концом запроса и началом ответа, сек
+        self.turnaround = float(turnaround)
+
+        self.char_time = char_time(self.baudrate, self.bytesize, parity, self.stopbits)
+        self.frame_gap = frame_gap(self.baudrate, self.bytesize, parity, self.stopbits)
+
+        self._serial: Optional[serial.Serial] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = asyncio.Lock()
+
+        self._rx = bytearray()
+        self._rx_expected = 0
+        self._rx_waiter: Optional[asyncio.Future] = None
+        # time.monotonic() последнего байта на шине (отправленного или принятого)
+        self._idle_since = 0.0
+        # До какого момента может прийти ответ на отменённый запрос
+        self._quiet_until = 0.0
+
+    def response_window(self, request_len: int, response_len: int) -> float:
+        """Время от начала отправки запроса до конца ответа исправного устройства, сек."""
+        return (request_len + response_len) * self.char_time + self.turnaround
+
+    @property
+    def is_open(self) -> bool:
+        return self._serial is not None and self._serial.is_open
+
+    def _open(self):
+        ser = serial.Serial(
+            port=self.port,
+            baudrate=self.baudrate,
+            bytesize=self.bytesize,
+            parity=_PARITY[self.parity],
+            stopbits=self.stopbits,
+            timeout=0,
+            write_timeout=0,
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_reader(ser.fileno(), self._on_readable)
+        except Exception:
+            ser.close()
+            raise
+        self._serial = ser
+        self._loop = loop
+
+    def close(self):
+        ser, self._serial = self._serial, None
+        if ser is None:
+            return
+        try:
+            self._loop.remove_reader(ser.fileno())
+        except Exception:
+            pass
+        try:
+            ser.close()
+        except Exception:
+            pass
+        self._fail_waiter(serial.SerialException(f"port {self.port} closed"))
+
+    def _fail_waiter(self, error: Exception):
+        waiter = self._rx_waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_exception(error)
+
+    def _on_readable(self):
+        try:
+            data = self._serial.read(256)
+        except Exception as e:
+            # Порт пропал (USB-адаптер выдернули): иначе колбэк крутился бы вхолостую.
+            self._fail_waiter(e)
+            self.close()
+            return
+
+        if not data:
+            return
+        self._idle_since = time.monotonic()
+
+        waiter = self._rx_waiter
+        if waiter is None or waiter.done():
+            # Байты вне транзакции (эхо, помехи, запоздавший ответ) — отбрасываем.
+            return
+
+        self._rx += data
+        need = self._rx_expected
+        if len(self._rx) >= 2 and self._rx[1] & 0x80:
+            need = 5  # ответ-исключение: адрес, функция|0x80, код, CRC
+        if len(self._rx) >= need:
+            waiter.set_result(bytes(self._rx[:need]))
+
+    async def _transact(self, slave_id: int, pdu: bytes, response_len: int) -> bytes:
+        async with self._lock:
+            if not self.is_open:
+                self._open()
+            ser = self._serial
+            loop = self._loop
+
+            # t3.5 тишины после предыдущего кадра — иначе устройство склеит кадры.
+            wait = max(self._idle_since, self._quiet_until) + self.frame_gap - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            request = _with_crc(bytes([slave_id]) + pdu)
+            ser.reset_input_buffer()
+            self._rx = bytearray()
+            self._rx_expected = response_len
+            waiter = loop.create_future()
+            self._rx_waiter = waiter
+
+            try:
+                written = ser.write(request)
+                sent_at = time.monotonic()
+                if written != len(request):
+                    raise serial.SerialTimeoutException(f"write to {self.port} incomplete: {written}/{len(request)}")
+                tx_time = len(request) * self.char_time
+                self._idle_since = sent_at + tx_time
+
+                try:
+                    response = await asyncio.wait_for(waiter, timeout=tx_time + self.timeout)
+                except asyncio.TimeoutError:
+                    if self._rx:
+                        raise InvalidResponseError(
+                            f"Incomplete response from slave {slave_id}: {len(self._rx)} of {response_len} bytes"
+                        ) from None
+                    raise NoResponseError(f"No communication with the instrument (no answer), slave {slave_id}") from None
+                except asyncio.CancelledError:
+                    # Запрос уже в линии: ответ может прийти позже. Полудуплекс —
+                    # следующий кадр только после окна ответа, а не через t3.5.
+                    self._quiet_until = sent_at + self.response_window(len(request), response_len)
+                    raise
+            finally:
+                self._rx_waiter = None
+
+        return self._check_response(slave_id, pdu[0], response)
+
+    @staticmethod
+    def _check_response(slave_id: int, function_code: int, response: bytes) -> bytes:
+        """Проверяет CRC, адрес и функцию; возвращает данные ответа без адреса, функции и CRC."""
+        if crc16(response[:-2]) != struct.unpack("<H", response[-2:])[0]:
+            raise InvalidResponseError(f"CRC mismatch in response from slave {slave_id}: {response.hex()}")
+        if response[0] != slave_id:
+            raise InvalidResponseError(f"Wrong slave address in response: {response[0]}, expected {slave_id}")
+
+        if response[1] == function_code | 0x80:
+            cls, message = _SLAVE_ERRORS.get(response[2], (SlaveReportedException, f"Slave reported error code {response[2]}"))
+            raise cls(message)
+        if response[1] != function_code:
+            raise InvalidResponseError(f"Wrong function code in response: {response[1]}, expected {function_code}")
+
+        return response[2:-2]
+
+    async def read_registers(self, slave_id: int, address: int, count: int, functioncode: int = 3) -> list[int]:
+        if functioncode not in (3, 4):
+            raise ValueError("functioncode must be 3 or 4")
+        pdu = struct.pack(">BHH", functioncode, address, count)
+        data = await self._transact(slave_id, pdu, 5 + 2 * count)
+        if data[0] != 2 * count:
+            raise InvalidResponseError(f"Wrong byte count in response: {data[0]}, expected {2 * count}")
+        return list(struct.unpack(f">{count}H", data[1:]))
+
+    async def write_register(self, slave_id: int, address: int, value: int) -> None:
+        """FC6. Устройство отвечает эхом запроса."""
+        pdu = struct.pack(">BHH", 6, address, value)
+        data = await self._transact(slave_id, pdu, 8)
+        if data != pdu[1:]:
+            raise InvalidResponseError(f"Wrong echo in write response: {data.hex()}")
+
+    async def write_registers(self, slave_id: int, address: int, values: list[int]) -> None:
+        """FC16. Ответ: адрес первого регистра и число записанных."""
+        n = len(values)
+        pdu = struct.pack(f">BHHB{n}H", 16, address, n, 2 * n, *values)
+        data = await self._transact(slave_id, pdu, 8)
+        if data != pdu[1:5]:
+            raise InvalidResponseError(f"Wrong write confirmation: {data.hex()}")
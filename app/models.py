@@ -1,6 +1,6 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy import Integer, String, Boolean, JSON
-from sqlalchemy import Float, DateTime
+from sqlalchemy import Float, DateTime, Index
 from datetime import datetime
 
 class Base(DeclarativeBase):
@@ -8,14 +8,44 @@ class Base(DeclarativeBase):
 
 class RackSensorHistory(Base):
     __tablename__ = "rack_sensor_history"
+    # Выборка «полка за период» — один проход по составному индексу.
+    # На существующих базах индекс создаёт bootstrap.ensure_db_tables.
+    __table_args__ = (Index("ix_rack_sensor_history_rack_created", "rack_id", "created_at"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    rack_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+    rack_id: Mapped[int] = mapped_column(Integer, nullable=False)
     sensor_slave_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
     soil_moisture: Mapped[float | None] = mapped_column(Float, nullable=True)
     soil_temperature: Mapped[float | None] = mapped_column(Float, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True, nullable=False)
 
+class RackSensorRollup(Base):
+    """
+    Агрегаты истории датчиков по интервалам (resolution_sec = 60 / 900 / 3600).
+    Обновляются инкрементально при каждой записи истории (app/sensor_rollup.py).
+    Среднее = *_sum / *_count.
+    """
+    __tablename__ = "rack_sensor_rollup"
+    # запрос «все полки за период» идёт по (resolution_sec, bucket_start), а не по полке
+    __table_args__ = (Index("ix_rack_sensor_rollup_res_bucket", "resolution_sec", "bucket_start"),)
+
+    resolution_sec: Mapped[int] = mapped_column(Integer, primary_key=True)
+    rack_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # unix time (UTC) начала интервала, кратен resolution_sec
+    bucket_start: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    samples: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    moisture_min: Mapped[float | None] = mapped_column(Float, nullable=True)
+    moisture_max: Mapped[float | None] = mapped_column(Float, nullable=True)
+    moisture_sum: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
+    moisture_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    temperature_min: Mapped[float | None] = mapped_column(Float, nullable=True)
+    temperature_max: Mapped[float | None] = mapped_column(Float, nullable=True)
+    temperature_sum: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
+    temperature_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
 class RackState(Base):
     __tablename__ = "rack_state"
     rack_id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -30,3 +60,24 @@ class RackSchedule(Base):
     __tablename__ = "rack_schedule"
     rack_id: Mapped[int] = mapped_column(Integer, primary_key=True)
     schedule_json: Mapped[dict] = mapped_column(JSON, default=dict)
+
+class CameraUpload(Base):
+    """
+    Очередь отправки фото в Google Drive (app/upload_queue.py).
+    Файл лежит в pending_dir, пока строка есть в таблице; после загрузки удаляются оба.
+    """
+    __tablename__ = "camera_upload_queue"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    path: Mapped[str] = mapped_column(String, unique=True, nullable=False)
+    filename: Mapped[str] = mapped_column(String, nullable=False)
+    size: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # повторные попытки: экспоненциальная пауза после каждой неудачи
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True, nullable=False)
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+
+    # адрес незавершённой resumable-сессии Drive: докачка продолжится с того же места
+    resumable_uri: Mapped[str | None] = mapped_column(String, nullable=True)
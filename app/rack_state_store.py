@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, replace
+from typing import Callable, Optional
+
+from sqlalchemy import select
+
+from .config import settings
+from .db import SessionLocal
+from .models import RackState
+
+_FIELDS = ("light_on", "water_on", "light_mode", "water_mode")
+
+
+@dataclass(frozen=True)
+class RackStateSnapshot:
+    rack_id: int
+    light_on: bool = False
+    water_on: bool = False
+    light_mode: str = "schedule"
+    water_mode: str = "schedule"
+
+
+class RackStateStore:
+    """
+    Состояние полок (вкл/выкл и режимы) живёт в памяти процесса.
+
+    Таблица rack_state читается один раз при старте; дальше /api/state, планировщик,
+    ручные команды и сервисы камер/истории читают только память. Изменения
+    пишутся в SQLite отложенно и пачкой (write-behind): одна транзакция
+    на все полки, изменившиеся за flush_delay_sec. При остановке — финальная запись.
+    """
+
+    def __init__(self, flush_delay_sec: float = 1.0):
+        self.flush_delay_sec = flush_delay_sec
+        self._states: dict[int, RackStateSnapshot] = {}
+        self._dirty: set[int] = set()
+        self._dirty_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._running = False
+        self._listeners: list[Callable[[int], None]] = []
+
+    def add_listener(self, callback: Callable[[int], None]):
+        """callback(rack_id) вызывается синхронно после каждого изменения в памяти."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[int], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    async def load(self):
+        # Несохранённые изменения важнее того, что лежит в БД.
+        await self.flush()
+        async with SessionLocal() as s:
+            rows = (await s.execute(select(RackState))).scalars().all()
+        self._states = {
+            int(row.rack_id): RackStateSnapshot(
+                rack_id=int(row.rack_id),
+                light_on=bool(row.light_on),
+                water_on=bool(row.water_on),
+                light_mode=row.light_mode or "schedule",
+                water_mode=row.water_mode or "schedule",
+            )
+            for row in rows
+        }
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # После финальной записи main вызывает db.checkpoint() — он делает fsync WAL и базы.
+        await self.flush()
+
+    async def _loop(self):
+        while self._running:
+            await self._dirty_event.wait()
+            # Небольшая задержка собирает изменения одного тика/нескольких кликов в одну транзакцию.
+            await asyncio.sleep(self.flush_delay_sec)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[rack_state] flush error: {e}")
+                await asyncio.sleep(5)
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._dirty:
+                self._dirty_event.clear()
+                return
+
+            batch = {rid: self._states[rid] for rid in self._dirty if rid in self._states}
+            self._dirty.clear()
+            self._dirty_event.clear()
+
+            try:
+                async with SessionLocal() as s:
+                    for rid, snap in batch.items():
+                        row = await s.get(RackState, rid)
+                        if row is None:
+                            row = RackState(rack_id=rid)
+                            s.add(row)
+                        for field in _FIELDS:
+                            setattr(row, field, getattr(snap, field))
+                    await s.commit()
+            except Exception:
+                # Не потеряли: попробуем снова при следующей записи.
+                self._dirty.update(batch)
+                self._dirty_event.set()
+                raise
+
+    def get(self, rack_id: int) -> Optional[RackStateSnapshot]:
+        return self._states.get(int(rack_id))
+
+    def all(self) -> list[RackStateSnapshot]:
+        return [self._states[rid] for rid in sorted(self._states)]
+
+    def update(self, rack_id: int, **fields) -> bool:
+        """Меняет поля полки в памяти и ставит запись в БД в очередь. True — если что-то изменилось."""
+        rack_id = int(rack_id)
+        current = self._states.get(rack_id) or RackStateSnapshot(rack_id=rack_id)
+        new = replace(current, **fields)
+        if new == current and rack_id in self._states:
+            return False
+
+        self._states[rack_id] = new
+        self._dirty.add(rack_id)
+        self._dirty_event.set()
+        for callback in self._listeners:
+            callback(rack_id)
+        return True
+
+
+rack_state_store = RackStateStore(flush_delay_sec=settings.state_flush_delay_seconds)
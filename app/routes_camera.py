@@ -2,9 +2,11 @@ from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import StreamingResponse
 from . import runtime
 from .camera_manager import camera_manager
+from .camera_capture_service import camera_capture_service
+from .upload_queue import upload_queue
 from .hw_config import CameraHW
+import asyncio
 import os
-import time
 
 router = APIRouter(prefix="/api", tags=["camera"])
 
@@ -74,43 +76,86 @@ def _get_camera_by_rack(rack_id: int) -> tuple[str, CameraHW]:
     )
 
 
-def _mjpeg_for_camera(cam: CameraHW, corrected: bool):
-    while True:
-        quality, frame_width, frame_height = _camera_runtime_settings()
-
-        jpeg = camera_manager.get_jpeg(
-            device=cam.device,
-            jpeg_quality=quality,
-            frame_width=frame_width,
-            frame_height=frame_height,
-
-            # Поворот должен применяться и к "До коррекции", и к "После коррекции".
-            # Иначе точки выбираются на одном изображении, а применяются к другому.
-            flip_vertical=cam.flip_vertical,
-            flip_horizontal=cam.flip_horizontal,
-
-            # Перспективу применяем только для правого изображения "После коррекции".
-            warp_enabled=cam.warp_enabled if corrected else False,
-            warp_points=cam.warp_points if corrected else None,
-
-            autofocus_enabled=cam.autofocus_enabled,
-            focus_absolute=cam.focus_absolute,
-            white_balance_auto=cam.white_balance_auto,
-            white_balance_temperature=cam.white_balance_temperature,
-        )
-
-        if jpeg:
-            yield (
-                b"--frame\r\n"
-                b"Content-Type: image/jpeg\r\n\r\n" +
-                jpeg +
-                b"\r\n"
+async def _mjpeg_for_camera(cam: CameraHW, corrected: bool):
+    """
+    Асинхронный MJPEG-поток: ждёт сигнала о новом кадре от CameraWorker, а не опрашивает
+    по таймеру, и не занимает поток из пула. Медленный клиент просто пропускает кадры:
+    после отправки он получает самый свежий кадр, очередь не копится.
+    """
+    last_seq = None
+    worker = None
+    worker_settings = None
+
+    try:
+        while True:
+            quality, frame_width, frame_height = _camera_runtime_settings()
+
+            settings = (
+                frame_width,
+                frame_height,
+                cam.autofocus_enabled,
+                cam.focus_absolute,
+                cam.white_balance_auto,
+                cam.white_balance_temperature,
+            )
+            if worker is None or settings != worker_settings:
+                # get_worker может перезапустить камеру (join потока) — не на event loop.
+                new_worker = await asyncio.to_thread(
+                    camera_manager.get_worker,
+                    device=cam.device,
+                    frame_width=frame_width,
+                    frame_height=frame_height,
+                    autofocus_enabled=cam.autofocus_enabled,
+                    focus_absolute=cam.focus_absolute,
+                    white_balance_auto=cam.white_balance_auto,
+                    white_balance_temperature=cam.white_balance_temperature,
+                )
+                worker_settings = settings
+
+                # Пока поток открыт, камера работает на полной частоте (счётчик зрителей).
+                if new_worker is not worker:
+                    if worker is not None:
+                        worker.release()
+                    new_worker.acquire()
+                    worker = new_worker
+
+            seq, jpeg = await worker.get_encoded_async(
+                jpeg_quality=quality,
+
+                # Поворот должен применяться и к "До коррекции", и к "После коррекции".
+                # Иначе точки выбираются на одном изображении, а применяются к другому.
+                flip_vertical=cam.flip_vertical,
+                flip_horizontal=cam.flip_horizontal,
+
+                # Перспективу применяем только для правого изображения "После коррекции".
+                warp_enabled=cam.warp_enabled if corrected else False,
+                warp_points=cam.warp_points if corrected else None,
             )
 
-        time.sleep(0.08)
+            if jpeg is None:
+                # Кадра нет (камера не открылась, прогревается, кадр не закодировался) —
+                # ждём следующий, иначе цикл крутится без await и вешает event loop.
+                await worker.wait_frame(seq, timeout=1.0)
+                continue
+
+            # Кадр не изменился — клиенту нечего отправлять.
+            if seq != last_seq:
+                last_seq = seq
+                yield (
+                    b"--frame\r\n"
+                    b"Content-Type: image/jpeg\r\n\r\n" +
+                    jpeg +
+                    b"\r\n"
+                )
+
+            await worker.wait_frame(last_seq, timeout=1.0)
+    finally:
+        # Клиент отключился: без зрителей камера перейдёт в редкий режим.
+        if worker is not None:
+            worker.release()
 
 @router.get("/rack/{rack_id}/camera/stream")
-def rack_camera_stream(rack_id: int):
+async def rack_camera_stream(rack_id: int):
     _, cam = _get_camera_by_rack(rack_id)
 
     return StreamingResponse(
@@ -121,7 +166,7 @@ def rack_camera_stream(rack_id: int):
 
 
 @router.get("/camera/{camera_id}/stream")
-def camera_stream(
+async def camera_stream(
     camera_id: str,
     corrected: bool = Query(default=True),
 ):
@@ -167,3 +212,15 @@ async def camera_info(camera_id: str):
         "exists": True,
         "last_error": camera_manager.get_error(cam.device),
     }
+
+
+@router.get("/camera/uploads")
+async def camera_uploads():
+    """Очередь отправки фото в Google Drive: глубина, скорость, ошибки."""
+    return await upload_queue.stats()
+
+
+@router.get("/camera/archive")
+async def camera_archive():
+    """Локальный архив снимков: размер по полкам, число дней, лимиты хранения."""
+    return camera_capture_service.archive_stats()
@@ -2,7 +2,9 @@ from fastapi import APIRouter, HTTPException
 from .hw_config import HWConfig, save_config, load_config
 from .schemas import HWConfigOut
 from . import runtime
+from .state_broadcaster import state_broadcaster
 from .bootstrap import ensure_db_racks
+from .rack_state_store import rack_state_store
 
 router = APIRouter(prefix="/api", tags=["config"])
 
@@ -76,5 +78,9 @@ async def set_config(payload: HWConfig):
     # переинициализируем драйвер/конфиг в runtime
     await runtime.init_runtime(active_low=True)
     await ensure_db_racks(runtime.cfg.racks_count)
+    # Новые полки появились в БД — подхватываем их в память.
+    await rack_state_store.load()
+    runtime.wake_scheduler()
+    state_broadcaster.notify()
 
     return {"ok": True}
\ No newline at end of file
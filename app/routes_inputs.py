@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from . import runtime
 
 router = APIRouter(prefix="/api", tags=["inputs"])
@@ -7,7 +7,21 @@ router = APIRouter(prefix="/api", tags=["inputs"])
 async def get_inputs():
     if not runtime.inputs:
         raise HTTPException(500, "inputs not initialized")
+    # Состояние из памяти: пины опрашивает фоновый поток InputsDriver.
+    states = runtime.inputs.states()
     return {
         "ok": True,
-        "levels": runtime.inputs.snapshot()
+        "levels": {name: st.active for name, st in states.items()},
+        "changed_at": {name: st.changed_at for name, st in states.items()},
+        "sampled_at": runtime.inputs.sampled_at,
+    }
+
+@router.get("/inputs/events")
+async def get_input_events(after: int = Query(0, ge=0)):
+    """Последние изменения датчиков уровня; after — номер последнего уже полученного события."""
+    if not runtime.inputs:
+        raise HTTPException(500, "inputs not initialized")
+    return {
+        "ok": True,
+        "events": runtime.inputs.events(after_seq=after),
     }
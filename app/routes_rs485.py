@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Query
+from . import runtime
+from .hw_config import save_config
+
+router = APIRouter(prefix="/api", tags=["rs485"])
+
+
+def _driver():
+    driver = runtime.driver
+    if not driver or not hasattr(driver, "bus"):
+        raise HTTPException(503, "RS485 driver not initialized")
+    return driver
+
+
+@router.get("/rs485/bus")
+async def get_bus_stats():
+    """Загрузка шины RS485 и время ожидания транзакций в очереди по приоритетам."""
+    return _driver().bus.stats()
+
+
+@router.get("/rs485/slaves")
+async def get_slave_health():
+    """Состояние устройств на шине: успехи/ошибки, задержка, автомат защиты датчиков."""
+    return {"ok": True, "slaves": _driver().slave_health()}
+
+
+@router.post("/rs485/slaves/{slave_id}/reset")
+async def reset_slave(slave_id: int):
+    """Возобновить опрос датчика сразу, не дожидаясь пробного запроса."""
+    if not _driver().reset_slave(slave_id):
+        raise HTTPException(404, f"slave {slave_id} not seen on the bus")
+    return {"ok": True}
+
+
+@router.post("/rs485/calibrate")
+async def calibrate_write_gap(channel: int = Query(1, ge=1, le=16)):
+    """
+    Подбирает паузу между кадрами для платы реле и сохраняет её в конфиг
+    (rs485.relay_write_gap_ms). Реле не переключаются: в канал пишется его известное
+    состояние; пока состояние ни одного канала неизвестно, калибровка невозможна.
+    """
+    driver = _driver()
+    try:
+        gap = await driver.calibrate_write_gap(channel)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    runtime.cfg.rs485.relay_write_gap_ms = round(gap * 1000, 2)
+    save_config(runtime.cfg)
+    return {"ok": True, "relay_write_gap_ms": runtime.cfg.rs485.relay_write_gap_ms}
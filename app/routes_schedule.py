@@ -3,7 +3,9 @@ from sqlalchemy import select
 from .db import SessionLocal
 from .models import RackSchedule
 from .schemas import RackSchedulePayload
+from .schedule_cache import schedule_cache
 from . import runtime
+from .state_broadcaster import state_broadcaster
 
 router = APIRouter(prefix="/api", tags=["schedule"])
 
@@ -40,4 +42,8 @@ async def set_schedule(rack_id: int, payload: RackSchedulePayload):
         else:
             s.add(RackSchedule(rack_id=rack_id, schedule_json=data))
         await s.commit()
+    # Единственное место, где расписание меняется, — здесь же пересобираем скомпилированную форму.
+    schedule_cache.update(rack_id, data)
+    runtime.wake_scheduler()
+    state_broadcaster.notify()
     return {"ok": True}
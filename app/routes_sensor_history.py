@@ -1,11 +1,17 @@
+import csv
+import io
+import json
+import math
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from fastapi import APIRouter, Query
-from sqlalchemy import select
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Integer, cast, func, select
 
 from .db import SessionLocal
-from .models import RackSensorHistory
+from .models import RackSensorHistory, RackSensorRollup
+from .sensor_rollup import RESOLUTIONS
 
 
 def get_moscow_tz():
@@ -20,17 +26,26 @@ UTC_TZ = timezone.utc
 
 router = APIRouter(prefix="/api", tags=["sensor-history"])
 
+# Сколько строк выгрузки читается из БД за один запрос
+EXPORT_PAGE_SIZE = 1000
+EXPORT_COLUMNS = ["id", "rack_id", "sensor_slave_id", "created_at", "soil_moisture", "soil_temperature"]
 
-@router.get("/sensor-history")
-async def get_sensor_history(
-    rack_id: int | None = None,
-    hours: int = Query(default=24, ge=1, le=24 * 30),
-):
-    dt_from = datetime.now(UTC_TZ) - timedelta(hours=hours)
 
+def _to_local_iso(dt: datetime) -> str:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=UTC_TZ)
+    return dt.astimezone(MOSCOW_TZ).isoformat()
+
+
+async def _raw_history(dt_from: datetime, rack_id: int | None) -> dict[str, list[dict]]:
     async with SessionLocal() as s:
         query = (
-            select(RackSensorHistory)
+            select(
+                RackSensorHistory.rack_id,
+                RackSensorHistory.created_at,
+                RackSensorHistory.soil_moisture,
+                RackSensorHistory.soil_temperature,
+            )
             .where(RackSensorHistory.created_at >= dt_from)
             .order_by(RackSensorHistory.created_at.asc())
         )
@@ -38,25 +53,265 @@ async def get_sensor_history(
         if rack_id is not None:
             query = query.where(RackSensorHistory.rack_id == rack_id)
 
-        rows = (await s.execute(query)).scalars().all()
+        rows = (await s.execute(query)).all()
 
     grouped: dict[str, list[dict]] = {}
 
     for r in rows:
-        dt = r.created_at
+        grouped.setdefault(str(r.rack_id), []).append({
+            "created_at": _to_local_iso(r.created_at),
+            "soil_moisture": r.soil_moisture,
+            "soil_temperature": r.soil_temperature,
+        })
 
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=UTC_TZ)
+    return grouped
 
-        dt_local = dt.astimezone(MOSCOW_TZ)
 
-        key = str(r.rack_id)
-        grouped.setdefault(key, []).append({
-            "created_at": dt_local.isoformat(),
-            "soil_moisture": r.soil_moisture,
-            "soil_temperature": r.soil_temperature,
+def _group_points(rows, bucket_sec: int) -> dict[str, list[dict]]:
+    grouped: dict[str, list[dict]] = {}
+
+    for rid, bk, m_min, m_avg, m_max, t_min, t_avg, t_max, count in rows:
+        grouped.setdefault(str(rid), []).append({
+            "created_at": _to_local_iso(datetime.fromtimestamp(bk * bucket_sec, UTC_TZ)),
+            # soil_moisture/soil_temperature — среднее за интервал (это рисует charts.js)
+            "soil_moisture": m_avg,
+            "soil_temperature": t_avg,
+            "soil_moisture_min": m_min,
+            "soil_moisture_max": m_max,
+            "soil_temperature_min": t_min,
+            "soil_temperature_max": t_max,
+            "count": count,
         })
 
+    return grouped
+
+
+async def _bucketed_history(dt_from: datetime, rack_id: int | None, bucket_sec: int) -> dict[str, list[dict]]:
+    """
+    min/avg/max по интервалам bucket_sec считаются в SQLite (GROUP BY номеру интервала),
+    в Python приходит уже готовая точка на интервал.
+    """
+    h = RackSensorHistory
+    bucket = (cast(func.strftime("%s", h.created_at), Integer) // bucket_sec).label("bucket")
+
+    query = (
+        select(
+            h.rack_id,
+            bucket,
+            func.min(h.soil_moisture),
+            func.avg(h.soil_moisture),
+            func.max(h.soil_moisture),
+            func.min(h.soil_temperature),
+            func.avg(h.soil_temperature),
+            func.max(h.soil_temperature),
+            func.count(),
+        )
+        .where(h.created_at >= dt_from)
+        .group_by(h.rack_id, bucket)
+        .order_by(h.rack_id, bucket)
+    )
+
+    if rack_id is not None:
+        query = query.where(h.rack_id == rack_id)
+
+    async with SessionLocal() as s:
+        rows = (await s.execute(query)).all()
+
+    return _group_points(rows, bucket_sec)
+
+
+async def _rollup_history(dt_from: datetime, rack_id: int | None, bucket_sec: int, resolution: int) -> dict[str, list[dict]]:
+    """То же, что _bucketed_history, но из готовых агрегатов: строк в resolution раз меньше, чем сырых."""
+    ro = RackSensorRollup
+    bucket = (ro.bucket_start // bucket_sec).label("bucket")
+    start = int(dt_from.timestamp())
+
+    query = (
+        select(
+            ro.rack_id,
+            bucket,
+            func.min(ro.moisture_min),
+            func.sum(ro.moisture_sum) / func.nullif(func.sum(ro.moisture_count), 0),
+            func.max(ro.moisture_max),
+            func.min(ro.temperature_min),
+            func.sum(ro.temperature_sum) / func.nullif(func.sum(ro.temperature_count), 0),
+            func.max(ro.temperature_max),
+            func.sum(ro.samples),
+        )
+        .where(
+            ro.resolution_sec == resolution,
+            ro.bucket_start >= start - start % resolution,
+        )
+        .group_by(ro.rack_id, bucket)
+        .order_by(ro.rack_id, bucket)
+    )
+
+    if rack_id is not None:
+        query = query.where(ro.rack_id == rack_id)
+
+    async with SessionLocal() as s:
+        rows = (await s.execute(query)).all()
+
+    return _group_points(rows, bucket_sec)
+
+
+def _pick_resolution(bucket_sec: int) -> int | None:
+    """Самые грубые агрегаты, из которых интервал bucket_sec собирается без остатка."""
+    for res in sorted(RESOLUTIONS, reverse=True):
+        if bucket_sec % res == 0:
+            return res
+    return None
+
+
+@router.get("/sensor-history")
+async def get_sensor_history(
+    rack_id: int | None = None,
+    hours: int = Query(default=24, ge=1, le=24 * 30),
+    max_points: int | None = Query(default=None, ge=10, le=5000),
+    bucket: int | None = Query(default=None, ge=1, le=24 * 3600),
+):
+    """
+    Без max_points/bucket — сырые точки, как раньше.
+    max_points — не больше стольких точек на полку (интервал подбирается по hours);
+    bucket — явная длина интервала агрегации в секундах.
+    Если интервал кратен 1 мин / 15 мин / 1 ч, данные берутся из таблицы агрегатов.
+    """
+    dt_from = datetime.now(UTC_TZ) - timedelta(hours=hours)
+
+    if bucket is None and max_points is None:
+        return {"items": await _raw_history(dt_from, rack_id)}
+
+    if bucket is not None:
+        bucket_sec = bucket
+    else:
+        # Интервалы выровнены по эпохе, поэтому период задевает на один интервал больше, чем делится нацело.
+        bucket_sec = math.ceil(hours * 3600 / (max_points - 1))
+        # Округляем вверх до кратного агрегатам — точек станет только меньше. Берём самые грубые,
+        # которых в интервал помещается хотя бы 4 (иначе округление съест слишком много точек);
+        # минутные — всегда, если интервал не короче минуты.
+        coarse = [
+            res for res in RESOLUTIONS
+            if res <= bucket_sec and (res == RESOLUTIONS[0] or res * 4 <= bucket_sec)
+        ]
+        if coarse:
+            bucket_sec = math.ceil(bucket_sec / coarse[-1]) * coarse[-1]
+
+    resolution = _pick_resolution(bucket_sec)
+    if resolution is None:
+        items = await _bucketed_history(dt_from, rack_id, bucket_sec)
+    else:
+        items = await _rollup_history(dt_from, rack_id, bucket_sec, resolution)
+
     return {
-        "items": grouped
-    }
\ No newline at end of file
+        "items": items,
+        "bucket_sec": bucket_sec,
+        "resolution_sec": resolution,
+    }
+
+
+def _as_utc_naive(dt: datetime) -> datetime:
+    # created_at хранится как UTC без зоны — сравниваем в том же виде
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(UTC_TZ).replace(tzinfo=None)
+
+
+async def _export_pages(
+    rack_id: int | None,
+    since: datetime | None,
+    until: datetime | None,
+    after_id: int,
+    limit: int | None,
+):
+    """
+    Keyset-пагинация по id: каждая страница — короткий отдельный запрос
+    WHERE id > последний_выданный ORDER BY id LIMIT n. В памяти не больше одной страницы,
+    SQLite не держит открытый курсор между страницами.
+    """
+    h = RackSensorHistory
+    cursor = after_id
+    left = limit
+
+    while left is None or left > 0:
+        page_size = EXPORT_PAGE_SIZE if left is None else min(EXPORT_PAGE_SIZE, left)
+
+        query = (
+            select(h.id, h.rack_id, h.sensor_slave_id, h.created_at, h.soil_moisture, h.soil_temperature)
+            .where(h.id > cursor)
+            .order_by(h.id)
+            .limit(page_size)
+        )
+        if rack_id is not None:
+            query = query.where(h.rack_id == rack_id)
+        if since is not None:
+            query = query.where(h.created_at >= _as_utc_naive(since))
+        if until is not None:
+            query = query.where(h.created_at < _as_utc_naive(until))
+
+        async with SessionLocal() as s:
+            rows = (await s.execute(query)).all()
+
+        if not rows:
+            return
+
+        yield rows
+        cursor = rows[-1].id
+        if left is not None:
+            left -= len(rows)
+        if len(rows) < page_size:
+            return
+
+
+def _export_record(r) -> dict:
+    dt = r.created_at
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=UTC_TZ)
+    return {
+        "id": r.id,
+        "rack_id": r.rack_id,
+        "sensor_slave_id": r.sensor_slave_id,
+        "created_at": dt.isoformat(),
+        "soil_moisture": r.soil_moisture,
+        "soil_temperature": r.soil_temperature,
+    }
+
+
+@router.get("/sensor-history/export")
+async def export_sensor_history(
+    format: str = Query(default="csv", pattern="^(csv|ndjson)$"),
+    rack_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    after_id: int = Query(default=0, ge=0),
+    limit: int | None = Query(default=None, ge=1),
+):
+    """
+    Потоковая выгрузка сырой истории (время в UTC), в порядке id.
+    Продолжить прерванную выгрузку: after_id = id последней полученной строки.
+    """
+
+    async def gen_csv():
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS)
+        writer.writeheader()
+        async for rows in _export_pages(rack_id, since, until, after_id, limit):
+            for r in rows:
+                writer.writerow(_export_record(r))
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+
+    async def gen_ndjson():
+        async for rows in _export_pages(rack_id, since, until, after_id, limit):
+            yield "".join(json.dumps(_export_record(r)) + "\n" for r in rows)
+
+    if format == "ndjson":
+        return StreamingResponse(gen_ndjson(), media_type="application/x-ndjson")
+
+    return StreamingResponse(
+        gen_csv(),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="sensor_history.csv"'},
+    )
@@ -1,88 +1,75 @@
 from fastapi import APIRouter
-from sqlalchemy import select
-from .db import SessionLocal
-from .models import RackState, RackSchedule
 from .schemas import RackStateOut
 from . import runtime
 from datetime import datetime
 from .schedule_info import compute_now_next
+from .schedule_cache import schedule_cache
+from .sensor_poller import sensor_poller
+from .rack_state_store import rack_state_store
 
 router = APIRouter(prefix="/api", tags=["state"])
 
 
-async def _read_soil_sensor_for_rack(rack_id: int) -> tuple[float | None, float | None]:
-    if not runtime.cfg or not runtime.driver:
-        return None, None
-
-    rack_cfg = runtime.cfg.racks.get(str(rack_id))
-    if not rack_cfg or rack_cfg.sensor_slave_id is None:
-        return None, None
+def collect_state() -> list[RackStateOut]:
+    """Текущее состояние всех полок. Только память — ни БД, ни шины; общий код для /api/state и стрима."""
+    max_racks = runtime.cfg.racks_count if runtime.cfg else 4
 
-    try:
-        return await runtime.driver.read_soil_sensor(rack_cfg.sensor_slave_id)
-    except Exception as e:
-        print(f"[state] failed to read soil sensor for rack {rack_id}: {e}")
-        return None, None
+    # Состояние полок — из памяти, в SQLite этот запрос не ходит.
+    states = [r for r in rack_state_store.all() if r.rack_id <= max_racks]
+
+    now = datetime.now()
+
+    out: list[RackStateOut] = []
+    for r in states:
+        compiled = schedule_cache.get(r.rack_id)
+
+        light_info = compute_now_next(compiled.light, now)
+        water_info = compute_now_next(compiled.water, now)
+
+        light_until = light_info.active_end if (r.light_on and light_info.active_end) else None
+        light_next = (None if r.light_on else light_info.next_text())
+        water_until = water_info.active_end if (r.water_on and water_info.active_end) else None
+        water_next = (None if r.water_on else water_info.next_text())
+
+        # Датчики опрашивает только sensor_poller, здесь берём значение из кэша.
+        soil = sensor_poller.get(r.rack_id)
+
+        rack_cfg = runtime.cfg.racks.get(str(r.rack_id)) if runtime.cfg else None
+        camera_id = rack_cfg.camera_id if rack_cfg else None
+        camera_cfg = runtime.cfg.cameras.get(camera_id) if runtime.cfg and camera_id else None
+
+        camera_device = camera_cfg.device if camera_cfg else (rack_cfg.camera_device if rack_cfg else None)
+        camera_flip_vertical = camera_cfg.flip_vertical if camera_cfg else (rack_cfg.camera_flip_vertical if rack_cfg else False)
+        camera_flip_horizontal = camera_cfg.flip_horizontal if camera_cfg else (rack_cfg.camera_flip_horizontal if rack_cfg else False)
+        camera_warp_enabled = camera_cfg.warp_enabled if camera_cfg else (rack_cfg.camera_warp_enabled if rack_cfg else False)
+        camera_warp_points = camera_cfg.warp_points if camera_cfg else (rack_cfg.camera_warp_points if rack_cfg else None)
+
+
+        out.append(RackStateOut(
+            rack_id=r.rack_id,
+            light_on=r.light_on,
+            water_on=r.water_on,
+            light_mode=r.light_mode,
+            water_mode=r.water_mode,
+            light_until=light_until,
+            light_next=light_next,
+            water_until=water_until,
+            water_next=water_next,
+            soil_moisture=soil.soil_moisture if soil else None,
+            soil_temperature=soil.soil_temperature if soil else None,
+            soil_age_sec=soil.age_sec() if soil else None,
+            soil_error=soil.last_error if soil else None,
+            camera_id=camera_id,
+            camera_device=camera_device,
+            camera_flip_vertical=camera_flip_vertical,
+            camera_flip_horizontal=camera_flip_horizontal,
+            camera_warp_enabled=camera_warp_enabled,
+            camera_warp_points=camera_warp_points,
+        ))
+
+    return out
 
 
 @router.get("/state", response_model=list[RackStateOut])
 async def get_state():
-    max_racks = runtime.cfg.racks_count if runtime.cfg else 4
-
-    async with SessionLocal() as s:
-        states = (await s.execute(select(RackState).order_by(RackState.rack_id))).scalars().all()
-        states = [r for r in states if r.rack_id <= max_racks]
-
-        schedules = {x.rack_id: x for x in (await s.execute(select(RackSchedule))).scalars().all()}
-        now = datetime.now()
-
-        out: list[RackStateOut] = []
-        for r in states:
-            sch = schedules.get(r.rack_id)
-            sch_json = (sch.schedule_json or {}) if sch else {}
-
-            light_ch = (sch_json.get("light") or {})
-            water_ch = (sch_json.get("water") or {})
-
-            light_info = compute_now_next(light_ch, now)
-            water_info = compute_now_next(water_ch, now)
-
-            light_until = light_info.active_end if (r.light_on and light_info.active_end) else None
-            light_next = (None if r.light_on else light_info.next_text())
-            water_until = water_info.active_end if (r.water_on and water_info.active_end) else None
-            water_next = (None if r.water_on else water_info.next_text())
-
-            soil_moisture, soil_temperature = await _read_soil_sensor_for_rack(r.rack_id)
-
-            rack_cfg = runtime.cfg.racks.get(str(r.rack_id)) if runtime.cfg else None
-            camera_id = rack_cfg.camera_id if rack_cfg else None
-            camera_cfg = runtime.cfg.cameras.get(camera_id) if runtime.cfg and camera_id else None
-
-            camera_device = camera_cfg.device if camera_cfg else (rack_cfg.camera_device if rack_cfg else None)
-            camera_flip_vertical = camera_cfg.flip_vertical if camera_cfg else (rack_cfg.camera_flip_vertical if rack_cfg else False)
-            camera_flip_horizontal = camera_cfg.flip_horizontal if camera_cfg else (rack_cfg.camera_flip_horizontal if rack_cfg else False)
-            camera_warp_enabled = camera_cfg.warp_enabled if camera_cfg else (rack_cfg.camera_warp_enabled if rack_cfg else False)
-            camera_warp_points = camera_cfg.warp_points if camera_cfg else (rack_cfg.camera_warp_points if rack_cfg else None)
-
-
-            out.append(RackStateOut(
-                rack_id=r.rack_id,
-                light_on=r.light_on,
-                water_on=r.water_on,
-                light_mode=r.light_mode,
-                water_mode=r.water_mode,
-                light_until=light_until,
-                light_next=light_next,
-                water_until=water_until,
-                water_next=water_next,
-                soil_moisture=soil_moisture,
-                soil_temperature=soil_temperature,
-                camera_id=camera_id,
-                camera_device=camera_device,
-                camera_flip_vertical=camera_flip_vertical,
-                camera_flip_horizontal=camera_flip_horizontal,
-                camera_warp_enabled=camera_warp_enabled,
-                camera_warp_points=camera_warp_points,
-            ))
-
-        return out
\ No newline at end of file
+    return collect_state()
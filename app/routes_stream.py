@@ -0,0 +1,48 @@
+import asyncio
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+from .state_broadcaster import state_broadcaster
+
+router = APIRouter(prefix="/api", tags=["stream"])
+
+
+@router.get("/stream/state")
+async def stream_state(request: Request):
+    """
+    Server-Sent Events: snapshot при подключении, затем diff по изменившимся полкам/входам
+    и heartbeat. Данные готовит общий state_broadcaster — клиент ничего не опрашивает сам.
+    """
+    q = await state_broadcaster.subscribe()
+
+    async def gen():
+        try:
+            yield "retry: 3000\n\n"
+            yield state_broadcaster.snapshot_message()
+            while True:
+                try:
+                    msg = await asyncio.wait_for(q.get(), timeout=5)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    continue
+
+                if msg == "":
+                    # сервер останавливается
+                    break
+                if msg is None:
+                    # клиент отстал и часть diff выброшена — отдаём полное состояние
+                    msg = state_broadcaster.snapshot_message()
+                yield msg
+        finally:
+            state_broadcaster.unsubscribe(q)
+
+    return StreamingResponse(
+        gen(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
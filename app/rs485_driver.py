@@ -2,12 +2,61 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 import asyncio
+import os
 import time
 import minimalmodbus
+import serial
+
+from .bus_scheduler import PRIO_RELAY, PRIO_SENSOR, PRIO_VERIFY, BusScheduler
+from .modbus_rtu import AsyncModbusRTU, frame_gap
 
 
 RELAY_ON = 0x0100
 RELAY_OFF = 0x0200
+CHANNELS = range(1, 17)
+
+# Чтение датчика, не начавшееся за это время (шина занята реле), пропускается
+_SENSOR_DEADLINE_SEC = 5.0
+
+# Датчик, не ответивший _BREAKER_ERRORS раз подряд, не опрашивается: пробный запрос
+# через _BREAKER_BASE_SEC, после каждой неудачной пробы пауза удваивается до _BREAKER_MAX_SEC.
+_BREAKER_ERRORS = 3
+_BREAKER_BASE_SEC = 10.0
+_BREAKER_MAX_SEC = 600.0
+
+# Сколько раз подряд плата должна промолчать на FC16 (при этом ответив на FC6),
+# чтобы групповая запись была отключена до перезапуска драйвера.
+_BULK_TIMEOUTS = 3
+
+
+class SlaveUnavailableError(RuntimeError):
+    """Датчик отключён автоматом защиты: запрос не отправлялся на шину."""
+
+
+@dataclass
+class RelayShadow:
+    # Что железу было сказано последним: None — неизвестно (после старта или ошибки записи).
+    on: bool | None = None
+    written_at: float = 0.0
+    verified_at: float = 0.0
+
+
+@dataclass
+class SlaveHealth:
+    slave_id: int
+    ok: int = 0
+    errors: int = 0
+    consecutive_errors: int = 0
+    # среднее (EMA) время успешной транзакции, мс
+    latency_ms: float | None = None
+    last_ok_at: float = 0.0
+    last_error_at: float = 0.0
+    last_error: str | None = None
+    # closed — опрашиваем как обычно; open — на шину не ходим до retry_at;
+    # probe — идёт пробный запрос после паузы
+    state: str = "closed"
+    trips: int = 0
+    retry_at: float = 0.0  # time.monotonic()
 
 
 @dataclass(frozen=True)
@@ -20,55 +69,505 @@ class RS485Config:
     slave_id: int = 1
     coil_base: int = 0     # смещение регистра (если вдруг нужно)
     timeout: float = 1.0
+    bulk_write: bool = True  # писать несколько каналов одной командой FC16, если плата умеет
+    transport: str = "asyncio"  # "asyncio" — свой RTU-транспорт на event loop, "minimalmodbus" — в потоке
+    write_gap: float | None = None  # пауза между кадрами, сек; None — 3.5 символа по скорости порта
+    turnaround: float = 0.05  # время реакции устройства на запрос, сек (для окна ответа)
 
 
 class RS485RelayDriver:
     """
     Драйвер для 16-канального RS485-реле и чтения Modbus-датчиков
     на том же RS485-порту.
+
+    По умолчанию транзакции идут через AsyncModbusRTU прямо на event loop.
+    transport="minimalmodbus" (и всегда на Windows) — прежний путь:
+    minimalmodbus в отдельном потоке.
     """
 
     def __init__(self, cfg: RS485Config):
         self.cfg = cfg
-        self._io_lock = asyncio.Lock()
-        self._instr = self._make_instrument(cfg.slave_id)
+        self._rtu: AsyncModbusRTU | None = None
+        if cfg.transport == "asyncio" and os.name != "nt":
+            self._rtu = AsyncModbusRTU(
+                port=cfg.port,
+                baudrate=cfg.baudrate,
+                parity=cfg.parity,
+                stopbits=cfg.stopbits,
+                bytesize=cfg.bytesize,
+                timeout=cfg.timeout,
+                turnaround=cfg.turnaround,
+            )
 
-    def _make_instrument(self, slave_id: int) -> minimalmodbus.Instrument:
-        instr = minimalmodbus.Instrument(self.cfg.port, int(slave_id))
-        instr.mode = minimalmodbus.MODE_RTU
+        # Все транзакции идут через очередь с приоритетами: команды реле обгоняют опрос датчиков.
+        # Прервать можно только транзакцию на asyncio-транспорте: вызов minimalmodbus
+        # в потоке отменить нельзя, он занимал бы порт параллельно со следующей командой.
+        # Порог прерывания — окно ответа исправного датчика (см. _sensor_preempt_after).
+        self.bus = BusScheduler()
+
+        # Тишина между кадрами: по умолчанию t3.5 от скорости порта; плате, которой нужно
+        # больше, задаётся rs485.relay_write_gap_ms (его подбирает calibrate_write_gap).
+        self.min_write_gap = frame_gap(cfg.baudrate, cfg.bytesize, cfg.parity, cfg.stopbits)
+        self.write_gap = self.min_write_gap
+        self.set_write_gap(cfg.write_gap)
 
-        instr.serial.baudrate = int(self.cfg.baudrate)
-        instr.serial.bytesize = int(self.cfg.bytesize)
-        instr.serial.stopbits = int(self.cfg.stopbits)
-        instr.serial.timeout = float(self.cfg.timeout)
+        # Ещё не записанные команды реле: по каналу остаётся только последняя (last-write-wins).
+        self._pending_relays: dict[int, bool] = {}
+        self._forced_relays: set[int] = set()
 
+        # Один serial-порт на всю шину и по одному Instrument на каждый slave_id.
+        # Порт открывается лениво при первой транзакции и переоткрывается после ошибки порта.
+        self._serial: serial.Serial | None = None
+        self._instruments: dict[int, minimalmodbus.Instrument] = {}
+
+        # Поддерживает ли плата FC16: None — ещё не проверяли.
+        self._bulk_supported: bool | None = None if cfg.bulk_write else False
+        self._bulk_timeouts = 0
+
+        # Теневое состояние 16 каналов: позволяет не слать на шину команды, которые
+        # ничего не меняют, и сверять железо с ожидаемым состоянием.
+        self._shadow: dict[int, RelayShadow] = {ch: RelayShadow() for ch in CHANNELS}
+
+        # Статистика по каждому slave_id на шине; для датчиков — ещё и автомат защиты.
+        self._health: dict[int, SlaveHealth] = {}
+        self._readback_supported = True
+
+    def _open_serial(self) -> serial.Serial:
         parity = (self.cfg.parity or "N").upper()
         if parity == "N":
-            instr.serial.parity = minimalmodbus.serial.PARITY_NONE
+            serial_parity = serial.PARITY_NONE
         elif parity == "E":
-            instr.serial.parity = minimalmodbus.serial.PARITY_EVEN
+            serial_parity = serial.PARITY_EVEN
         elif parity == "O":
-            instr.serial.parity = minimalmodbus.serial.PARITY_ODD
+            serial_parity = serial.PARITY_ODD
         else:
             raise ValueError(f"Unsupported parity: {self.cfg.parity!r}. Use N/E/O.")
 
+        return serial.Serial(
+            port=self.cfg.port,
+            baudrate=int(self.cfg.baudrate),
+            bytesize=int(self.cfg.bytesize),
+            parity=serial_parity,
+            stopbits=int(self.cfg.stopbits),
+            timeout=float(self.cfg.timeout),
+            write_timeout=2.0,
+        )
+
+    def _get_instrument(self, slave_id: int) -> minimalmodbus.Instrument:
+        slave_id = int(slave_id)
+
+        if self._serial is None or not self._serial.is_open:
+            self._reset_port()
+            self._serial = self._open_serial()
+
+        instr = self._instruments.get(slave_id)
+        if instr is not None:
+            return instr
+
+        instr = minimalmodbus.Instrument(self._serial, slave_id)
+        instr.mode = minimalmodbus.MODE_RTU
         instr.clear_buffers_before_each_transaction = True
+        self._instruments[slave_id] = instr
         return instr
 
+    def _reset_port(self) -> None:
+        """Закрывает порт и сбрасывает пул: следующая транзакция откроет порт заново."""
+        self._instruments.clear()
+        if self._serial is not None:
+            try:
+                self._serial.close()
+            except Exception:
+                pass
+        self._serial = None
+
+    @staticmethod
+    def _is_port_error(e: Exception) -> bool:
+        # ModbusException тоже наследуется от IOError, но это ошибка протокола/датчика,
+        # а не порта: переоткрывать порт из-за неё не нужно.
+        if isinstance(e, minimalmodbus.ModbusException):
+            return False
+        return isinstance(e, (serial.SerialException, OSError))
+
+    def _call(self, slave_id: int, fn_name: str, *args, **kwargs):
+        instr = self._get_instrument(slave_id)
+        try:
+            return getattr(instr, fn_name)(*args, **kwargs)
+        except Exception as e:
+            if self._is_port_error(e):
+                print(f"[RS485] port error on {self.cfg.port}, reconnecting: {e}")
+                self._reset_port()
+            raise
+
+    def close(self) -> None:
+        self.bus.close()
+        self._reset_port()
+        if self._rtu is not None:
+            self._rtu.close()
+
+    def set_write_gap(self, gap: float | None) -> None:
+        self.write_gap = max(self.min_write_gap, gap or 0.0)
+        if self._rtu is not None:
+            # asyncio-транспорт сам выдерживает паузу перед следующим кадром.
+            self._rtu.frame_gap = self.write_gap
+
+    async def _after_write(self) -> None:
+        # minimalmodbus сам ждёт t3.5 перед следующим запросом; добавляем только разницу.
+        if self._rtu is None and self.write_gap > self.min_write_gap:
+            await asyncio.sleep(self.write_gap - self.min_write_gap)
+
+    def _sensor_preempt_after(self, count: int) -> float:
+        # Пауза перед запросом + запрос FC3 (8 байт) + ответ (5 + 2*count) + реакция устройства:
+        # раньше прерывать нельзя — живой датчик ещё не успел бы ответить.
+        return self._rtu.frame_gap + self._rtu.response_window(8, 5 + 2 * count)
+
+    async def _rtu_call(self, coro):
+        try:
+            return await coro
+        except Exception as e:
+            if self._is_port_error(e):
+                print(f"[RS485] port error on {self.cfg.port}, reconnecting: {e}")
+                self._rtu.close()
+            raise
+
+    async def _tracked(self, slave_id: int, coro):
+        started = time.monotonic()
+        try:
+            result = await coro
+        except Exception as e:
+            self._record(slave_id, started, e)
+            raise
+        self._record(slave_id, started)
+        return result
+
+    async def _read_registers(self, slave_id: int, address: int, count: int) -> list[int]:
+        if self._rtu is not None:
+            return await self._tracked(
+                slave_id,
+                self._rtu_call(self._rtu.read_registers(int(slave_id), address, count, functioncode=3)),
+            )
+        return await self._tracked(slave_id, asyncio.to_thread(
+            self._call,
+            slave_id,
+            "read_registers",
+            registeraddress=address,
+            number_of_registers=count,
+            functioncode=3,
+        ))
+
+    async def _write_register(self, slave_id: int, address: int, value: int) -> None:
+        if self._rtu is not None:
+            return await self._tracked(slave_id, self._rtu_call(self._rtu.write_register(int(slave_id), address, value)))
+        await self._tracked(
+            slave_id,
+            asyncio.to_thread(self._call, slave_id, "write_register", address, value, functioncode=6),
+        )
+
+    async def _write_registers(self, slave_id: int, address: int, values: list[int]) -> None:
+        if self._rtu is not None:
+            return await self._tracked(slave_id, self._rtu_call(self._rtu.write_registers(int(slave_id), address, values)))
+        await self._tracked(slave_id, asyncio.to_thread(self._call, slave_id, "write_registers", address, values))
+
+    def _health_for(self, slave_id: int) -> SlaveHealth:
+        slave_id = int(slave_id)
+        h = self._health.get(slave_id)
+        if h is None:
+            h = self._health[slave_id] = SlaveHealth(slave_id=slave_id)
+        return h
+
+    def _record(self, slave_id: int, started: float, error: Exception | None = None) -> None:
+        h = self._health_for(slave_id)
+        now = time.time()
+
+        if error is None:
+            latency = (time.monotonic() - started) * 1000
+            h.latency_ms = latency if h.latency_ms is None else h.latency_ms * 0.8 + latency * 0.2
+            h.ok += 1
+            h.last_ok_at = now
+            h.consecutive_errors = 0
+            if h.state != "closed":
+                print(f"[RS485] slave {slave_id} is responding again, polling resumed")
+            h.state = "closed"
+            h.trips = 0
+            return
+
+        h.errors += 1
+        h.last_error_at = now
+        h.last_error = str(error)
+        if self._is_port_error(error):
+            # Пропал сам порт — датчик тут ни при чём.
+            return
+
+        h.consecutive_errors += 1
+        # Плату реле не отключаем никогда: команды реле должны уходить всегда.
+        if slave_id == self.cfg.slave_id:
+            return
+        if h.state == "probe" or h.consecutive_errors >= _BREAKER_ERRORS:
+            h.trips += 1
+            pause = min(_BREAKER_MAX_SEC, _BREAKER_BASE_SEC * 2 ** (h.trips - 1))
+            h.state = "open"
+            h.retry_at = time.monotonic() + pause
+            print(f"[RS485] slave {slave_id} failed {h.consecutive_errors} times, next probe in {pause:.0f}s: {error}")
+
+    def slave_health(self) -> list[dict]:
+        """Статистика транзакций и состояние автомата защиты по каждому slave_id."""
+        mono = time.monotonic()
+        out = []
+        for slave_id in sorted(self._health):
+            h = self._health[slave_id]
+            out.append({
+                "slave_id": slave_id,
+                "role": "relay" if slave_id == self.cfg.slave_id else "sensor",
+                "state": h.state,
+                "ok": h.ok,
+                "errors": h.errors,
+                "consecutive_errors": h.consecutive_errors,
+                "latency_ms": round(h.latency_ms, 1) if h.latency_ms is not None else None,
+                "last_ok_at": h.last_ok_at or None,
+                "last_error_at": h.last_error_at or None,
+                "last_error": h.last_error,
+                "retry_in_sec": round(max(0.0, h.retry_at - mono), 1) if h.state == "open" else None,
+            })
+        return out
+
+    def reset_slave(self, slave_id: int) -> bool:
+        """Снимает автомат защиты (датчик заменили/подключили): следующий опрос — сразу."""
+        h = self._health.get(int(slave_id))
+        if h is None:
+            return False
+        h.state = "closed"
+        h.trips = 0
+        h.consecutive_errors = 0
+        return True
+
     def _reg_for_channel(self, channel: int) -> int:
         if not 1 <= channel <= 16:
             raise ValueError("channel must be in 1..16")
         return int(self.cfg.coil_base) + int(channel)
 
-    def _set_relay_sync(self, channel: int, on: bool) -> None:
+    def _remember(self, channel: int, on: bool | None) -> None:
+        sh = self._shadow[channel]
+        sh.on = on
+        sh.written_at = time.time() if on is not None else 0.0
+
+    async def _write_relay(self, channel: int, on: bool) -> None:
         reg = self._reg_for_channel(channel)
         value = RELAY_ON if on else RELAY_OFF
-        self._instr.write_register(reg, value, functioncode=6)
-        time.sleep(0.03)
+        try:
+            await self._write_register(self.cfg.slave_id, reg, value)
+        except Exception:
+            self._remember(channel, None)
+            raise
+        self._remember(channel, on)
+        await self._after_write()
+
+    async def set_relay(self, channel: int, on: bool, force: bool = False) -> None:
+        await self.set_relays({channel: on}, force=force)
 
-    async def set_relay(self, channel: int, on: bool) -> None:
-        async with self._io_lock:
-            await asyncio.to_thread(self._set_relay_sync, channel, on)
+    @staticmethod
+    def _contiguous_runs(channels: list[int]) -> list[list[int]]:
+        runs: list[list[int]] = []
+        for ch in sorted(channels):
+            if runs and runs[-1][-1] == ch - 1:
+                runs[-1].append(ch)
+            else:
+                runs.append([ch])
+        return runs
+
+    async def _write_run(self, run: list[int], mapping: dict[int, bool]) -> None:
+        # FC16 с теми же командами, что и FC6: по регистру на канал, 0x0100/0x0200.
+        values = [RELAY_ON if mapping[ch] else RELAY_OFF for ch in run]
+        try:
+            await self._write_registers(self.cfg.slave_id, self._reg_for_channel(run[0]), values)
+        except Exception:
+            for ch in run:
+                self._remember(ch, None)
+            raise
+        for ch in run:
+            self._remember(ch, mapping[ch])
+        await self._after_write()
+
+    async def _set_relays_bulk(self, runs: list[list[int]], mapping: dict[int, bool]) -> bool:
+        """Пишет группы каналов через FC16. False — групповая запись не удалась."""
+        try:
+            for run in runs:
+                await self._write_run(run, mapping)
+        except minimalmodbus.IllegalRequestError as e:
+            if "illegal function" in str(e):
+                print(f"[RS485] bulk write is not supported by the relay board, using per-channel writes: {e}")
+                self._bulk_supported = False
+            else:
+                print(f"[RS485] bulk write rejected, retrying per channel: {e}")
+            return False
+        except minimalmodbus.NoResponseError as e:
+            # Одиночный таймаут — ещё не повод отключать FC16 (помеха, плата перезагружается);
+            # решение принимает _write_relays, когда видит, ответила ли плата на FC6.
+            self._bulk_timeouts += 1
+            print(f"[RS485] no response to bulk write, retrying per channel: {e}")
+            return False
+        except Exception as e:
+            print(f"[RS485] bulk write failed, retrying per channel: {e}")
+            return False
+
+        self._bulk_supported = True
+        self._bulk_timeouts = 0
+        return True
+
+    async def _write_relays(self, mapping: dict[int, bool]) -> None:
+        pending = sorted(mapping)
+
+        if self._bulk_supported is not False:
+            runs = [run for run in self._contiguous_runs(pending) if len(run) > 1]
+            if runs and await self._set_relays_bulk(runs, mapping):
+                done = {ch for run in runs for ch in run}
+                pending = [ch for ch in pending if ch not in done]
+
+        failed: list[str] = []
+        for ch in pending:
+            try:
+                await self._write_relay(ch, mapping[ch])
+            except Exception as e:
+                failed.append(f"{ch}: {e}")
+
+        if self._bulk_timeouts:
+            if failed:
+                # Плата не отвечает вообще — молчание на FC16 ничего не говорит о его поддержке.
+                self._bulk_timeouts = 0
+            elif self._bulk_timeouts >= _BULK_TIMEOUTS and self._bulk_supported is None:
+                # Плата молча игнорирует FC16 — больше не пробуем.
+                print(f"[RS485] relay board ignores bulk writes ({self._bulk_timeouts} timeouts), using per-channel writes")
+                self._bulk_supported = False
+
+        if failed:
+            raise RuntimeError("failed to set relays " + "; ".join(failed))
+
+    async def set_relays(self, mapping: dict[int, bool], force: bool = False) -> None:
+        """
+        Выставляет сразу несколько каналов {channel: on} минимальным числом транзакций.
+        Если плата не умеет групповую запись — пишет по одному каналу.
+        Каналы, которые уже в нужном состоянии (по теневому состоянию), пропускаются,
+        если не указан force=True.
+        """
+        mapping = {int(ch): bool(on) for ch, on in mapping.items()}
+        for ch in mapping:
+            self._reg_for_channel(ch)
+
+        if not mapping:
+            return
+
+        self._pending_relays.update(mapping)
+        if force:
+            self._forced_relays.update(mapping)
+
+        # Пока запись ещё в очереди, новые команды дописываются в неё же: одна транзакция
+        # на все накопившиеся каналы, и по каждому каналу пишется только последнее значение.
+        await self.bus.run(self._flush_relays, PRIO_RELAY, name="relays", key="relays")
+
+    async def _flush_relays(self) -> None:
+        mapping, self._pending_relays = self._pending_relays, {}
+        forced, self._forced_relays = self._forced_relays, set()
+
+        mapping = {ch: on for ch, on in mapping.items() if ch in forced or self._shadow[ch].on != on}
+        if mapping:
+            await self._write_relays(mapping)
+
+    async def apply_bitmap(self, bitmap: int, force: bool = False) -> None:
+        """Выставляет все 16 каналов: бит 0 — канал 1, ..., бит 15 — канал 16."""
+        await self.set_relays({ch: bool(bitmap >> (ch - 1) & 1) for ch in CHANNELS}, force=force)
+
+    def relay_states(self) -> dict[int, RelayShadow]:
+        """Копия теневого состояния каналов."""
+        return {ch: RelayShadow(sh.on, sh.written_at, sh.verified_at) for ch, sh in self._shadow.items()}
+
+    async def _read_relays(self) -> list[bool]:
+        # Плата отдаёт состояние канала в тех же регистрах: 1 — включен, 0 — выключен.
+        regs = await self._read_registers(self.cfg.slave_id, self._reg_for_channel(1), len(CHANNELS))
+        if not regs or len(regs) < len(CHANNELS):
+            raise RuntimeError("Relay board returned not enough registers")
+        return [bool(v) for v in regs[:len(CHANNELS)]]
+
+    async def verify_relays(self) -> list[int]:
+        """
+        Читает состояние реле с платы и исправляет каналы, которые расходятся
+        с теневым состоянием (например, если потерялся кадр записи).
+        Возвращает список исправленных каналов.
+        """
+        if not self._readback_supported:
+            return []
+
+        # Чтение и исправление — одна транзакция очереди: команда реле не вклинится между ними.
+        return await self.bus.run(self._verify_relays, PRIO_VERIFY, name="verify")
+
+    async def _verify_relays(self) -> list[int]:
+        try:
+            actual = await self._read_relays()
+        except minimalmodbus.IllegalRequestError as e:
+            print(f"[RS485] relay read-back is not supported by the board, verify disabled: {e}")
+            self._readback_supported = False
+            return []
+
+        now = time.time()
+        heal: dict[int, bool] = {}
+        for ch, is_on in zip(CHANNELS, actual):
+            sh = self._shadow[ch]
+            if sh.on is None:
+                continue
+            if sh.on == is_on:
+                sh.verified_at = now
+            else:
+                heal[ch] = sh.on
+
+        if heal:
+            print(f"[RS485] relay state mismatch on channels {sorted(heal)}, rewriting")
+            await self._write_relays(heal)
+
+        return sorted(heal)
+
+    async def calibrate_write_gap(self, channel: int = 1, trials: int = 5) -> float:
+        """
+        Подбирает паузу между кадрами для этой платы: от t3.5 вверх, пока две записи
+        канала подряд не пройдут trials раз. В канал пишется только его известное
+        теневое состояние, так что реле не переключаются; если состояние канала
+        неизвестно, берётся другой канал с известным.
+        Возвращает найденную паузу с запасом 50% и сразу начинает её использовать.
+        """
+        self._reg_for_channel(channel)
+        return await self.bus.run(lambda: self._calibrate_write_gap(channel, trials), PRIO_VERIFY, name="calibrate")
+
+    def _calibration_channel(self, channel: int) -> int:
+        if self._shadow[channel].on is not None:
+            return channel
+        for ch in CHANNELS:
+            if self._shadow[ch].on is not None:
+                return ch
+        raise RuntimeError("Состояние реле ещё неизвестно — задайте его, затем повторите калибровку")
+
+    async def _calibrate_write_gap(self, channel: int, trials: int) -> float:
+        previous = self.write_gap
+        base = self.min_write_gap
+        candidates = sorted({base, base * 2, 0.005, 0.01, 0.02, 0.03, 0.05, 0.1})
+        channel = self._calibration_channel(channel)
+        reg = self._reg_for_channel(channel)
+
+        for gap in (g for g in candidates if g >= base):
+            self.set_write_gap(gap)
+            try:
+                for _ in range(trials):
+                    for _ in range(2):
+                        # Калибровка держит шину, так что тень канала за это время не меняется.
+                        value = RELAY_ON if self._shadow[channel].on else RELAY_OFF
+                        await self._write_register(self.cfg.slave_id, reg, value)
+                        await self._after_write()
+            except Exception as e:
+                print(f"[RS485] calibrate: gap {gap * 1000:.2f} ms is not enough: {e}")
+                continue
+
+            learned = max(base, gap * 1.5)
+            self.set_write_gap(learned)
+            print(f"[RS485] calibrate: stable at {gap * 1000:.2f} ms, using {learned * 1000:.2f} ms")
+            return learned
+
+        self.set_write_gap(previous)
+        raise RuntimeError("Плата не отвечает стабильно даже с паузой 100 мс")
 
     async def relay_on(self, channel: int) -> None:
         await self.set_relay(channel, True)
@@ -77,30 +576,44 @@ class RS485RelayDriver:
         await self.set_relay(channel, False)
 
     async def all_off(self):
-        for ch in range(1, 17):
-            try:
-                await self.set_relay(ch, False)
-            except Exception as e:
-                print(f"[RS485] failed to turn off relay {ch}: {e}")
+        try:
+            await self.apply_bitmap(0, force=True)
+        except Exception as e:
+            print(f"[RS485] failed to turn off relays: {e}")
 
     @staticmethod
     def _to_signed_16(v: int) -> int:
         return v - 65536 if v > 32767 else v
 
-    def _read_soil_sensor_sync(self, slave_id: int) -> tuple[float, float]:
+    async def read_soil_sensor(self, slave_id: int) -> tuple[float, float]:
         """
         Читает датчик почвы по Modbus RTU:
         регистры 0x0000..0x0002, используем:
           reg0 = влажность / 10
           reg1 = температура (signed int16) / 10
+
+        Датчик, который перестал отвечать, не занимает шину: пока действует
+        автомат защиты, вызов сразу завершается SlaveUnavailableError.
         """
-        instr = self._make_instrument(slave_id)
+        h = self._health_for(slave_id)
+        if h.state == "probe" or (h.state == "open" and time.monotonic() < h.retry_at):
+            raise SlaveUnavailableError(f"Датчик {slave_id} не отвечает, опрос приостановлен")
+        if h.state == "open":
+            h.state = "probe"
 
-        regs = instr.read_registers(
-            registeraddress=0,
-            number_of_registers=3,
-            functioncode=3,
-        )
+        try:
+            regs = await self.bus.run(
+                lambda: self._read_registers(slave_id, 0, 3),
+                PRIO_SENSOR,
+                name=f"sensor {slave_id}",
+                deadline_sec=_SENSOR_DEADLINE_SEC,
+                preemptible=self._rtu is not None,
+                preempt_after_sec=self._sensor_preempt_after(3) if self._rtu is not None else None,
+            )
+        finally:
+            if h.state == "probe":
+                # Проба так и не дошла до шины (срок, отмена, ошибка порта) — попробуем в следующий раз.
+                h.state = "open"
 
         if not regs or len(regs) < 2:
             raise RuntimeError("Sensor returned not enough registers")
@@ -112,7 +625,3 @@ class RS485RelayDriver:
         soil_temperature = self._to_signed_16(temp_raw) / 10.0
 
         return soil_moisture, soil_temperature
-
-    async def read_soil_sensor(self, slave_id: int) -> tuple[float, float]:
-        async with self._io_lock:
-            return await asyncio.to_thread(self._read_soil_sensor_sync, slave_id)
\ No newline at end of file
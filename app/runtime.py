@@ -1,63 +1,46 @@
 from __future__ import annotations
 
-from typing import Optional, Any
-from datetime import datetime, time, timedelta
-
-from sqlalchemy import select
+from typing import Optional, Any, Callable
+from datetime import datetime
 
 from .hw_config import HWConfig, load_config
 from .rs485_driver import RS485RelayDriver, RS485Config
 from .inputs_driver import InputsDriver
 
-from .db import SessionLocal
-from .models import RackState, RackSchedule
-
-
-DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
-
+from .schedule_cache import schedule_cache
+from .rack_state_store import rack_state_store
 
-def _parse_schedule_time(value: str) -> time:
-    parts = str(value or "").strip().split(":")
-    if len(parts) == 2:
-        hh, mm = parts
-        ss = 0
-    elif len(parts) == 3:
-        hh, mm, ss = parts
-    else:
-        raise ValueError("time must be HH:MM or HH:MM:SS")
-    return time(int(hh), int(mm), int(ss))
 
+cfg: Optional[HWConfig] = None
+driver: Optional[Any] = None
+inputs: Optional[InputsDriver] = None
+scheduler: Optional[Any] = None
 
-def _in_any_range(now: datetime, ranges: list[dict]) -> bool:
-    for r in ranges:
-        try:
-            st = _parse_schedule_time(r.get("start"))
-            en = _parse_schedule_time(r.get("end"))
-        except Exception:
-            continue
+# Подписчики на изменения датчиков уровня. Живут здесь, а не в InputsDriver,
+# чтобы пережить пересоздание драйвера при перезагрузке конфига.
+inputs_listeners: list[Callable[[str, bool], None]] = []
 
-        start_dt = now.replace(hour=st.hour, minute=st.minute, second=st.second, microsecond=0)
-        end_dt = now.replace(hour=en.hour, minute=en.minute, second=en.second, microsecond=0)
 
-        # поддержка интервалов через полночь, например 23:59:30–00:00:10
-        if end_dt <= start_dt:
-            end_dt += timedelta(days=1)
-            if now < start_dt:
-                start_dt -= timedelta(days=1)
+def _inputs_changed(name: str, active: bool) -> None:
+    # Вызывается из потока опроса входов; копия — список могут менять с event loop.
+    for callback in list(inputs_listeners):
+        callback(name, active)
 
-        if start_dt <= now < end_dt:
-            return True
-    return False
 
-cfg: Optional[HWConfig] = None
-driver: Optional[Any] = None
-inputs: Optional[InputsDriver] = None
+def wake_scheduler() -> None:
+    """Расписание, режим или конфиг изменились — планировщик должен пересчитать состояние сразу."""
+    if scheduler is not None:
+        scheduler.wake()
 
 
 async def init_runtime(active_low: bool = True) -> None:
     global cfg, driver,inputs
     cfg = load_config()
 
+    # При перезагрузке конфига освобождаем порт предыдущего драйвера.
+    if driver is not None and hasattr(driver, "close"):
+        driver.close()
+
     if not cfg.rs485:
         raise RuntimeError("RS485 config missing: add rs485 section to config/kisamore.yaml")
 
@@ -71,78 +54,78 @@ async def init_runtime(active_low: bool = True) -> None:
         slave_id=r.slave_id,
         coil_base=r.coil_base,
         timeout=r.timeout,
+        bulk_write=r.bulk_write,
+        transport=r.transport,
+        write_gap=r.relay_write_gap_ms / 1000 if r.relay_write_gap_ms is not None else None,
+        turnaround=r.device_turnaround_ms / 1000,
     ))
-    print(f"[KisaMore] RS485 driver enabled on {r.port}, slave_id={r.slave_id}, coil_base={r.coil_base}")
+    print(
+        f"[KisaMore] RS485 driver enabled on {r.port}, slave_id={r.slave_id}, "
+        f"coil_base={r.coil_base}, transport={r.transport}, frame_gap={driver.write_gap * 1000:.2f}ms"
+    )
 
     # NEW: входы (датчики уровня)
-    inputs = InputsDriver(cfg.level_sensors)
+    # Старый драйвер останавливаем: у него свой поток опроса и настроенные пины.
+    if inputs is not None:
+        inputs.close()
+    inputs = InputsDriver(cfg.level_sensors, on_change=_inputs_changed)
     print(f"[KisaMore] Inputs enabled: {cfg.level_sensors}")
 
 async def safety_reset_and_sync_relays() -> None:
     """
     Fail-safe при старте:
     1) выключаем ВСЕ реле (на случай, если что-то "залипло" после падения)
-    2) сразу же приводим железо в соответствие с текущими режимами/расписанием из БД:
+    2) сразу же приводим железо в соответствие с текущими режимами/расписанием:
        - manual: восстанавливаем light_on/water_on
-       - schedule: вычисляем состояние по текущему времени и обновляем БД
+       - schedule: вычисляем состояние по текущему времени и обновляем rack_state_store
 
-    Важно: эту функцию нужно вызывать ПОСЛЕ ensure_db_tables/ensure_db_racks.
+    Важно: эту функцию нужно вызывать ПОСЛЕ ensure_db_tables/ensure_db_racks, schedule_cache.load() и rack_state_store.load().
     """
 
     if not cfg or not driver:
         return
 
-    # 1) выключаем все реле
-    for ch in range(1, 17):
-        try:
-            await driver.set_relay(ch, False)
-        except Exception as e:
-            print(f"[KisaMore] FAIL-SAFE: can't turn off relay {ch}: {e}")
+    # 1) выключаем все реле (одной групповой командой, если плата умеет).
+    # force: реальное состояние железа после перезапуска неизвестно.
+    try:
+        await driver.apply_bitmap(0, force=True)
+    except Exception as e:
+        print(f"[KisaMore] FAIL-SAFE: can't turn off relays: {e}")
 
     # 2) синхронизируем нужные состояния
     now = datetime.now()
-    day_key = DAYS[now.weekday()]
-
-    async with SessionLocal() as s:
-        states = (await s.execute(select(RackState))).scalars().all()
-        schedules = {x.rack_id: x for x in (await s.execute(select(RackSchedule))).scalars().all()}
-
-        for st in states:
-            if st.rack_id > cfg.racks_count:
-                continue
-            rack_cfg = cfg.racks.get(str(st.rack_id))
-            if not rack_cfg:
-                continue
-
-            sch = schedules.get(st.rack_id)
-            sch_json = sch.schedule_json if sch else {}
-
-            # Свет
-            if st.light_mode == "manual":
-                want_light = bool(st.light_on)
-            else:
-                light_ranges = (((sch_json.get("light") or {}).get(day_key)) or [])
-                want_light = _in_any_range(now, light_ranges)
-                st.light_on = want_light
-
-            # Полив
-            if st.water_mode == "manual":
-                want_water = bool(st.water_on)
-            else:
-                water_ranges = (((sch_json.get("water") or {}).get(day_key)) or [])
-                want_water = _in_any_range(now, water_ranges)
-                st.water_on = want_water
-
-            try:
-                await driver.set_relay(rack_cfg.light_relay, want_light)
-            except Exception as e:
-                print(f"[KisaMore] sync: can't set light relay for rack {st.rack_id}: {e}")
-
-            try:
-                await driver.set_relay(rack_cfg.water_relay, want_water)
-            except Exception as e:
-                print(f"[KisaMore] sync: can't set water relay for rack {st.rack_id}: {e}")
-
-        await s.commit()
+    desired: dict[int, bool] = {}
+
+    for st in rack_state_store.all():
+        if st.rack_id > cfg.racks_count:
+            continue
+        rack_cfg = cfg.racks.get(str(st.rack_id))
+        if not rack_cfg:
+            continue
+
+        compiled = schedule_cache.get(st.rack_id)
+
+        # Свет
+        if st.light_mode == "manual":
+            want_light = bool(st.light_on)
+        else:
+            want_light = compiled.light.is_on(now)
+
+        # Полив
+        if st.water_mode == "manual":
+            want_water = bool(st.water_on)
+        else:
+            want_water = compiled.water.is_on(now)
+
+        rack_state_store.update(st.rack_id, light_on=want_light, water_on=want_water)
+        desired[rack_cfg.light_relay] = want_light
+        desired[rack_cfg.water_relay] = want_water
+
+    # Включаем только то, что должно быть включено: остальное уже выключено шагом 1.
+    to_enable = {ch: True for ch, on in desired.items() if on}
+    try:
+        await driver.set_relays(to_enable)
+    except Exception as e:
+        print(f"[KisaMore] sync: can't set relays {sorted(to_enable)}: {e}")
 
     print("[KisaMore] FAIL-SAFE: all relays OFF, then synced to DB state/schedule")
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from sqlalchemy import select
+
+from .db import SessionLocal
+from .models import RackSchedule
+
+DAY_KEYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+DAY_SEC = 24 * 3600
+WEEK_SEC = 7 * DAY_SEC
+
+
+def parse_schedule_time(value: str) -> int:
+    """"HH:MM" или "HH:MM:SS" -> секунды от начала суток."""
+    parts = str(value or "").strip().split(":")
+    if len(parts) == 2:
+        hh, mm = parts
+        ss = 0
+    elif len(parts) == 3:
+        hh, mm, ss = parts
+    else:
+        raise ValueError("time must be HH:MM or HH:MM:SS")
+    hh, mm, ss = int(hh), int(mm), int(ss)
+    if not (0 <= hh < 24 and 0 <= mm < 60 and 0 <= ss < 60):
+        raise ValueError("time out of range")
+    return hh * 3600 + mm * 60 + ss
+
+
+@dataclass(frozen=True)
+class Interval:
+    # секунды от понедельника 00:00 (могут выходить за пределы недели — это соседние недели)
+    start: int
+    end: int
+    # как время было записано в расписании, для подписей в UI
+    start_text: str
+    end_text: str
+
+
+class CompiledChannel:
+    """
+    Расписание одного канала (свет или полив), разобранное один раз:
+    отсортированные непересекающиеся интервалы в секундах недели, переход через
+    полночь и через конец недели уже учтён. Все запросы — бинарный поиск.
+
+    Интервал дня d "start–end" с end <= start длится до end следующего дня.
+    """
+
+    def __init__(self, channel: dict[str, list[dict[str, Any]]] | None):
+        raw: list[Interval] = []
+        for day_idx, day_key in enumerate(DAY_KEYS):
+            for it in ((channel or {}).get(day_key) or []):
+                start_text = str((it or {}).get("start") or "").strip()
+                end_text = str((it or {}).get("end") or "").strip()
+                if not start_text or not end_text:
+                    continue
+                try:
+                    st = parse_schedule_time(start_text)
+                    en = parse_schedule_time(end_text)
+                except Exception:
+                    continue
+
+                duration = (en - st) % DAY_SEC or DAY_SEC
+                start = day_idx * DAY_SEC + st
+                raw.append(Interval(start, start + duration, start_text, end_text))
+
+        # Копии на прошлую и следующую неделю: так интервал воскресенье 22:00–02:00
+        # виден в понедельник ночью, а «следующее включение» находится без зацикливания.
+        shifted = sorted(
+            (Interval(iv.start + k * WEEK_SEC, iv.end + k * WEEK_SEC, iv.start_text, iv.end_text)
+             for iv in raw for k in (-1, 0, 1)),
+            key=lambda iv: iv.start,
+        )
+
+        merged: list[Interval] = []
+        for iv in shifted:
+            if merged and iv.start <= merged[-1].end:
+                last = merged[-1]
+                if iv.end > last.end:
+                    merged[-1] = Interval(last.start, iv.end, last.start_text, iv.end_text)
+                continue
+            merged.append(iv)
+
+        self.intervals = merged
+        self._starts = [iv.start for iv in merged]
+
+    @staticmethod
+    def _week_pos(now: datetime) -> tuple[datetime, float]:
+        week_start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=now.weekday())
+        return week_start, (now - week_start).total_seconds()
+
+    def active(self, now: datetime) -> Optional[Interval]:
+        _, t = self._week_pos(now)
+        i = bisect_right(self._starts, t) - 1
+        if i >= 0 and t < self.intervals[i].end:
+            return self.intervals[i]
+        return None
+
+    def is_on(self, now: datetime) -> bool:
+        return self.active(now) is not None
+
+    def active_until(self, now: datetime) -> Optional[datetime]:
+        week_start, t = self._week_pos(now)
+        i = bisect_right(self._starts, t) - 1
+        if i >= 0 and t < self.intervals[i].end:
+            return week_start + timedelta(seconds=self.intervals[i].end)
+        return None
+
+    def next_on(self, now: datetime) -> Optional[tuple[datetime, Interval]]:
+        week_start, t = self._week_pos(now)
+        i = bisect_right(self._starts, t)
+        if i < len(self.intervals):
+            iv = self.intervals[i]
+            return week_start + timedelta(seconds=iv.start), iv
+        return None
+
+    def next_change(self, now: datetime) -> Optional[datetime]:
+        """Ближайший момент, когда канал включится или выключится."""
+        until = self.active_until(now)
+        if until is not None:
+            return until
+        nxt = self.next_on(now)
+        return nxt[0] if nxt else None
+
+
+@dataclass
+class CompiledSchedule:
+    light: CompiledChannel
+    water: CompiledChannel
+
+    @classmethod
+    def from_json(cls, schedule_json: dict | None) -> "CompiledSchedule":
+        data = schedule_json or {}
+        return cls(
+            light=CompiledChannel(data.get("light")),
+            water=CompiledChannel(data.get("water")),
+        )
+
+
+_EMPTY = CompiledSchedule.from_json(None)
+
+
+class ScheduleCache:
+    """
+    Скомпилированные расписания всех полок. Загружаются из БД при старте
+    и пересобираются только при записи расписания (routes_schedule.set_schedule).
+    """
+
+    def __init__(self):
+        self._racks: dict[int, CompiledSchedule] = {}
+
+    async def load(self):
+        async with SessionLocal() as s:
+            rows = (await s.execute(select(RackSchedule))).scalars().all()
+        self._racks = {row.rack_id: CompiledSchedule.from_json(row.schedule_json) for row in rows}
+
+    def update(self, rack_id: int, schedule_json: dict | None):
+        self._racks[int(rack_id)] = CompiledSchedule.from_json(schedule_json)
+
+    def get(self, rack_id: int) -> CompiledSchedule:
+        return self._racks.get(int(rack_id), _EMPTY)
+
+
+schedule_cache = ScheduleCache()
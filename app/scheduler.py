@@ -1,50 +1,32 @@
 import asyncio
-from datetime import datetime, time, timedelta
-from sqlalchemy import select
+from time import monotonic
+from datetime import datetime
 from .config import settings
-from .db import SessionLocal
-from .models import RackState, RackSchedule
-
-DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
-
-def _parse_schedule_time(value: str) -> time:
-    parts = str(value or "").strip().split(":")
-    if len(parts) == 2:
-        hh, mm = parts
-        ss = 0
-    elif len(parts) == 3:
-        hh, mm, ss = parts
-    else:
-        raise ValueError("time must be HH:MM or HH:MM:SS")
-    return time(int(hh), int(mm), int(ss))
-
-
-def _in_any_range(now: datetime, ranges: list[dict]) -> bool:
-    for r in ranges:
-        try:
-            st = _parse_schedule_time(r.get("start"))
-            en = _parse_schedule_time(r.get("end"))
-        except Exception:
-            continue
-
-        start_dt = now.replace(hour=st.hour, minute=st.minute, second=st.second, microsecond=0)
-        end_dt = now.replace(hour=en.hour, minute=en.minute, second=en.second, microsecond=0)
-
-        # поддержка интервалов через полночь, например 23:59:30–00:00:10
-        if end_dt <= start_dt:
-            end_dt += timedelta(days=1)
-            if now < start_dt:
-                start_dt -= timedelta(days=1)
-
-        if start_dt <= now < end_dt:
-            return True
-    return False
+from .schedule_cache import schedule_cache
+from .rack_state_store import rack_state_store
+
+def _earliest(a: datetime | None, b: datetime | None) -> datetime | None:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
 
 class Scheduler:
+    """
+    Планировщик не опрашивает БД по таймеру: после каждого прохода он вычисляет
+    ближайший фронт расписания (включение/выключение любого канала) и спит до него.
+    Раньше его будит wake() — при изменении расписания, режима или конфига.
+    """
+
     def __init__(self, runtime):
         self.runtime = runtime
         self._task: asyncio.Task | None = None
         self._stop = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._last_verify = 0.0
+        self.next_edge: datetime | None = None
 
     async def start(self):
         self._stop.clear()
@@ -52,49 +34,111 @@ class Scheduler:
 
     async def stop(self):
         self._stop.set()
+        self._wake.set()
         if self._task:
             await self._task
 
+    def wake(self):
+        """Пересчитать состояние немедленно (расписание/режим/конфиг изменились)."""
+        self._wake.set()
+
     async def _run(self):
         while not self._stop.is_set():
+            self._wake.clear()
+            next_edge = None
+            failed = False
             try:
-                await self.tick()
+                next_edge = await self.tick()
             except Exception as e:
                 print("[SCHED] error:", e)
-            await asyncio.sleep(settings.scheduler_tick_seconds)
+                failed = True
+            self.next_edge = next_edge
 
-    async def tick(self):
+            verify_in = None
+            try:
+                verify_in = await self.verify_if_due()
+            except Exception as e:
+                print("[SCHED] verify error:", e)
+
+            # Потолок сна страхует от перевода часов (NTP на Pi без RTC) и пропущенных wake().
+            timeout = float(settings.scheduler_max_sleep_seconds)
+            if next_edge is not None:
+                # небольшой запас, чтобы проснуться уже после фронта, а не за миг до него
+                timeout = min(timeout, max(0.0, (next_edge - datetime.now()).total_seconds()) + 0.05)
+            if verify_in is not None:
+                timeout = min(timeout, verify_in)
+            if failed:
+                # Реле не переключились — повторяем скоро, а не на следующем фронте.
+                timeout = min(timeout, float(settings.scheduler_retry_seconds))
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def verify_if_due(self) -> float | None:
+        """
+        Периодически сверяет реле с платой, чтобы потерянный кадр не висел до следующего фронта.
+        Возвращает, через сколько секунд нужна следующая сверка (None — сверка выключена).
+        """
+        cfg = self.runtime.cfg
+        driver = self.runtime.driver
+        if not cfg or not cfg.rs485 or not driver or not hasattr(driver, "verify_relays"):
+            return None
+
+        interval = cfg.rs485.verify_interval_sec
+        if not interval:
+            return None
+
+        now = monotonic()
+        if now - self._last_verify < interval:
+            return interval - (now - self._last_verify)
+        self._last_verify = now
+
+        healed = await driver.verify_relays()
+        if healed:
+            print(f"[SCHED] verify: rewrote relays {healed}")
+        return float(interval)
+
+    async def tick(self) -> datetime | None:
+        """Приводит реле в соответствие с расписанием и возвращает ближайший фронт."""
         if not self.runtime.cfg or not self.runtime.driver:
-            return
+            return None
 
         now = datetime.now()
-        day_key = DAYS[now.weekday()]
-
-        async with SessionLocal() as s:
-            states = (await s.execute(select(RackState))).scalars().all()
-            schedules = {x.rack_id: x for x in (await s.execute(select(RackSchedule))).scalars().all()}
-
-            for st in states:
-                if st.rack_id > self.runtime.cfg.racks_count:
-                    continue
-
-                sch = schedules.get(st.rack_id)
-                sch_json = sch.schedule_json if sch else {}
-
-                if st.light_mode == "schedule":
-                    light_ranges = (((sch_json.get("light") or {}).get(day_key)) or [])
-                    want = _in_any_range(now, light_ranges)
-                    if want != st.light_on:
-                        st.light_on = want
-                        relay_id = self.runtime.cfg.racks[str(st.rack_id)].light_relay
-                        await self.runtime.driver.set_relay(relay_id, want)
-
-                if st.water_mode == "schedule":
-                    water_ranges = (((sch_json.get("water") or {}).get(day_key)) or [])
-                    want = _in_any_range(now, water_ranges)
-                    if want != st.water_on:
-                        st.water_on = want
-                        relay_id = self.runtime.cfg.racks[str(st.rack_id)].water_relay
-                        await self.runtime.driver.set_relay(relay_id, want)
-
-            await s.commit()
+        changes: dict[int, bool] = {}
+        next_edge: datetime | None = None
+
+        updates: dict[int, dict[str, bool]] = {}
+
+        for st in rack_state_store.all():
+            if st.rack_id > self.runtime.cfg.racks_count:
+                continue
+
+            rack_cfg = self.runtime.cfg.racks.get(str(st.rack_id))
+            if not rack_cfg:
+                continue
+
+            compiled = schedule_cache.get(st.rack_id)
+
+            if st.light_mode == "schedule":
+                want = compiled.light.is_on(now)
+                if want != st.light_on:
+                    updates.setdefault(st.rack_id, {})["light_on"] = want
+                    changes[rack_cfg.light_relay] = want
+                next_edge = _earliest(next_edge, compiled.light.next_change(now))
+
+            if st.water_mode == "schedule":
+                want = compiled.water.is_on(now)
+                if want != st.water_on:
+                    updates.setdefault(st.rack_id, {})["water_on"] = want
+                    changes[rack_cfg.water_relay] = want
+                next_edge = _earliest(next_edge, compiled.water.next_change(now))
+
+        # Все изменения этого тика — одной групповой записью.
+        # Состояние обновляем только после успешной записи: иначе следующий тик повторит попытку.
+        await self.runtime.driver.set_relays(changes)
+        for rack_id, fields in updates.items():
+            rack_state_store.update(rack_id, **fields)
+
+        return next_edge
@@ -37,6 +37,9 @@ class RackStateOut(BaseModel):
 
     soil_moisture: Optional[float] = None
     soil_temperature: Optional[float] = None
+    # Сколько секунд назад было последнее успешное чтение датчика (None — ещё не было)
+    soil_age_sec: Optional[float] = None
+    soil_error: Optional[str] = None
 
     camera_id: Optional[str] = None
     camera_device: Optional[str] = None
@@ -3,16 +3,17 @@ from __future__ import annotations
 import asyncio
 from datetime import datetime, timezone
 
-from sqlalchemy import select
-
-from .db import SessionLocal
-from .models import RackSensorHistory, RackState
+from .history_writer import history_writer
+from .rack_state_store import rack_state_store
+from .sensor_poller import sensor_poller
 from . import runtime
 
 
 class SensorHistoryService:
-    def __init__(self, interval_sec: int = 300):
+    def __init__(self, interval_sec: int = 300, max_sample_age_sec: float = 60):
         self.interval_sec = interval_sec
+        # Значение из кэша старше этого считаем отсутствующим (датчик не отвечает).
+        self.max_sample_age_sec = max_sample_age_sec
         self._task: asyncio.Task | None = None
         self._running = False
 
@@ -33,11 +34,12 @@ class SensorHistoryService:
 
     async def _loop(self):
         while self._running:
+            # Сначала ждём: к первой записи sensor_poller уже успеет опросить датчики.
+            await asyncio.sleep(self.interval_sec)
             try:
                 await self.collect_once()
             except Exception as e:
                 print(f"[sensor_history] collect error: {e}")
-            await asyncio.sleep(self.interval_sec)
 
     async def collect_once(self):
         if not runtime.cfg or not runtime.driver:
@@ -45,38 +47,45 @@ class SensorHistoryService:
 
         max_racks = runtime.cfg.racks_count
 
-        async with SessionLocal() as s:
-            states = (await s.execute(
-                select(RackState).order_by(RackState.rack_id)
-            )).scalars().all()
-
-            for st in states:
-                if st.rack_id > max_racks:
-                    continue
-
-                rack_cfg = runtime.cfg.racks.get(str(st.rack_id))
-                if not rack_cfg:
-                    continue
-
-                sensor_slave_id = rack_cfg.sensor_slave_id
-                if sensor_slave_id is None:
-                    continue
-
-                soil_moisture = None
-                soil_temperature = None
-
-                try:
-                    soil_moisture, soil_temperature = await runtime.driver.read_soil_sensor(sensor_slave_id)
-                except Exception as e:
-                    print(f"[sensor_history] rack {st.rack_id} sensor read failed: {e}")
-
-                row = RackSensorHistory(
-                    rack_id=st.rack_id,
-                    sensor_slave_id=sensor_slave_id,
-                    soil_moisture=soil_moisture,
-                    soil_temperature=soil_temperature,
-                    created_at=datetime.now(timezone.utc),
-                )
-                s.add(row)
-
-            await s.commit()
\ No newline at end of file
+        rows = []
+        now = datetime.now(timezone.utc)
+        for st in rack_state_store.all():
+            if st.rack_id > max_racks:
+                continue
+
+            rack_cfg = runtime.cfg.racks.get(str(st.rack_id))
+            if not rack_cfg:
+                continue
+
+            sensor_slave_id = rack_cfg.sensor_slave_id
+            if sensor_slave_id is None:
+                continue
+
+            soil_moisture = None
+            soil_temperature = None
+
+            # На шину не ходим: берём последнее значение, прочитанное sensor_poller.
+            reading = sensor_poller.get(st.rack_id)
+            age = reading.age_sec() if reading else None
+            fresh = (
+                reading is not None
+                and reading.sensor_slave_id == sensor_slave_id
+                and age is not None
+                and age <= self.max_sample_age_sec
+            )
+            if fresh:
+                soil_moisture = reading.soil_moisture
+                soil_temperature = reading.soil_temperature
+            else:
+                print(f"[sensor_history] rack {st.rack_id} has no fresh sensor reading")
+
+            rows.append({
+                "rack_id": st.rack_id,
+                "sensor_slave_id": sensor_slave_id,
+                "soil_moisture": soil_moisture,
+                "soil_temperature": soil_temperature,
+                "created_at": now,
+            })
+
+        # В БД не пишем: строки копятся в history_writer и уходят пачкой.
+        history_writer.add(rows)
\ No newline at end of file
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from . import runtime
+
+
+@dataclass
+class SoilReading:
+    soil_moisture: Optional[float] = None
+    soil_temperature: Optional[float] = None
+    sensor_slave_id: Optional[int] = None
+    # time.time() последнего успешного чтения
+    updated_at: float = 0.0
+    # time.time() последней попытки (успешной или нет)
+    attempted_at: float = 0.0
+    last_error: Optional[str] = None
+
+    def age_sec(self, now: Optional[float] = None) -> Optional[float]:
+        if not self.updated_at:
+            return None
+        return max(0.0, (now or time.time()) - self.updated_at)
+
+
+class SensorPoller:
+    """
+    Единственный владелец чтения датчиков почвы с RS485.
+
+    Опрашивает все полки по кругу и хранит последнее значение в памяти.
+    /api/state и SensorHistoryService читают только кэш и никогда не ходят
+    на шину сами, поэтому запросы UI не конкурируют с записью реле.
+    """
+
+    def __init__(self, interval_sec: float = 5.0):
+        self.interval_sec = interval_sec
+        self._task: asyncio.Task | None = None
+        self._running = False
+        self._readings: dict[int, SoilReading] = {}
+        self._listeners: list[Callable[[int], None]] = []
+
+    def add_listener(self, callback: Callable[[int], None]):
+        """callback(rack_id) — значение или ошибка датчика полки изменились."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[int], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, rack_id: int):
+        for callback in self._listeners:
+            callback(rack_id)
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _loop(self):
+        while self._running:
+            try:
+                await self.poll_once()
+            except Exception as e:
+                print(f"[sensor_poller] poll error: {e}")
+            await asyncio.sleep(self.interval_sec)
+
+    async def poll_once(self):
+        if not runtime.cfg or not runtime.driver:
+            return
+
+        for rack_id_str, rack_cfg in runtime.cfg.racks.items():
+            rack_id = int(rack_id_str)
+            if rack_id > runtime.cfg.racks_count:
+                continue
+
+            slave_id = rack_cfg.sensor_slave_id
+            if slave_id is None:
+                self._readings.pop(rack_id, None)
+                continue
+
+            reading = self._readings.get(rack_id)
+            if reading is None or reading.sensor_slave_id != slave_id:
+                # Сменился адрес датчика в конфиге — старое значение уже не про эту полку.
+                reading = SoilReading(sensor_slave_id=slave_id)
+                self._readings[rack_id] = reading
+
+            reading.attempted_at = time.time()
+            try:
+                moisture, temperature = await runtime.driver.read_soil_sensor(slave_id)
+            except Exception as e:
+                if reading.last_error != str(e):
+                    print(f"[sensor_poller] rack {rack_id} sensor read failed: {e}")
+                    reading.last_error = str(e)
+                    self._notify(rack_id)
+                continue
+
+            changed = (
+                reading.soil_moisture != moisture
+                or reading.soil_temperature != temperature
+                or reading.last_error is not None
+            )
+            reading.soil_moisture = moisture
+            reading.soil_temperature = temperature
+            reading.updated_at = reading.attempted_at
+            reading.last_error = None
+            if changed:
+                self._notify(rack_id)
+
+    def get(self, rack_id: int) -> Optional[SoilReading]:
+        return self._readings.get(int(rack_id))
+
+
+sensor_poller = SensorPoller()
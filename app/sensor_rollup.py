@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import Integer, cast, delete, func, insert, literal, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .db import SessionLocal
+from .models import RackSensorHistory, RackSensorRollup
+
+# Разрешения агрегатов, секунды: 1 мин / 15 мин / 1 ч
+RESOLUTIONS = (60, 900, 3600)
+
+_COMBINE_MIN = ("moisture_min", "temperature_min")
+_COMBINE_MAX = ("moisture_max", "temperature_max")
+_COMBINE_ADD = ("samples", "moisture_sum", "moisture_count", "temperature_sum", "temperature_count")
+
+
+def _epoch(dt: datetime) -> int:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _aggregate(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Сводит пачку сырых строк в агрегаты всех разрешений (ещё без учёта того, что уже в БД)."""
+    out: dict[tuple[int, int, int], dict[str, Any]] = {}
+
+    for row in rows:
+        ts = _epoch(row["created_at"])
+        for res in RESOLUTIONS:
+            key = (res, int(row["rack_id"]), ts - ts % res)
+            agg = out.get(key)
+            if agg is None:
+                agg = out[key] = {
+                    "resolution_sec": key[0],
+                    "rack_id": key[1],
+                    "bucket_start": key[2],
+                    "samples": 0,
+                    "moisture_min": None,
+                    "moisture_max": None,
+                    "moisture_sum": 0.0,
+                    "moisture_count": 0,
+                    "temperature_min": None,
+                    "temperature_max": None,
+                    "temperature_sum": 0.0,
+                    "temperature_count": 0,
+                }
+
+            agg["samples"] += 1
+            for src, prefix in (("soil_moisture", "moisture"), ("soil_temperature", "temperature")):
+                v = row.get(src)
+                if v is None:
+                    continue
+                lo, hi = agg[f"{prefix}_min"], agg[f"{prefix}_max"]
+                agg[f"{prefix}_min"] = v if lo is None else min(lo, v)
+                agg[f"{prefix}_max"] = v if hi is None else max(hi, v)
+                agg[f"{prefix}_sum"] += v
+                agg[f"{prefix}_count"] += 1
+
+    return list(out.values())
+
+
+async def upsert_rollups(session: AsyncSession, rows: list[dict[str, Any]]):
+    """
+    Добавляет пачку сырых строк в агрегаты. Вызывается в той же транзакции,
+    что и INSERT сырой истории (HistoryWriter.flush), поэтому они не расходятся.
+    """
+    aggregates = _aggregate(rows)
+    if not aggregates:
+        return
+
+    t = RackSensorRollup.__table__.c
+    stmt = sqlite_insert(RackSensorRollup)
+    ex = stmt.excluded
+
+    # В SQLite min(a, b) с NULL даёт NULL, поэтому подставляем второе значение вместо пустого.
+    set_ = {}
+    for name in _COMBINE_MIN:
+        set_[name] = func.min(func.coalesce(t[name], ex[name]), func.coalesce(ex[name], t[name]))
+    for name in _COMBINE_MAX:
+        set_[name] = func.max(func.coalesce(t[name], ex[name]), func.coalesce(ex[name], t[name]))
+    for name in _COMBINE_ADD:
+        set_[name] = t[name] + ex[name]
+
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.resolution_sec, t.rack_id, t.bucket_start],
+        set_=set_,
+    )
+    await session.execute(stmt, aggregates)
+
+
+async def backfill_if_empty():
+    """
+    Разовое построение агрегатов по уже накопленной истории (база от версии без агрегатов).
+    Если агрегаты уже есть — ничего не делает.
+    """
+    async with SessionLocal() as s:
+        has_rollups = (await s.execute(select(RackSensorRollup.rack_id).limit(1))).first()
+        has_raw = (await s.execute(select(RackSensorHistory.id).limit(1))).first()
+        if has_rollups or not has_raw:
+            return
+
+        h = RackSensorHistory
+        for res in RESOLUTIONS:
+            bucket = ((cast(func.strftime("%s", h.created_at), Integer) // res) * res).label("bucket_start")
+            query = (
+                select(
+                    literal(res),
+                    h.rack_id,
+                    bucket,
+                    func.count(),
+                    func.min(h.soil_moisture),
+                    func.max(h.soil_moisture),
+                    func.total(h.soil_moisture),
+                    func.count(h.soil_moisture),
+                    func.min(h.soil_temperature),
+                    func.max(h.soil_temperature),
+                    func.total(h.soil_temperature),
+                    func.count(h.soil_temperature),
+                )
+                .group_by(h.rack_id, bucket)
+            )
+            await s.execute(insert(RackSensorRollup).from_select([
+                "resolution_sec", "rack_id", "bucket_start", "samples",
+                "moisture_min", "moisture_max", "moisture_sum", "moisture_count",
+                "temperature_min", "temperature_max", "temperature_sum", "temperature_count",
+            ], query))
+        await s.commit()
+    print("[sensor_rollup] rollups rebuilt from existing history")
+
+
+async def prune():
+    """Удаляет сырую историю и минутные агрегаты старше сроков из настроек."""
+    now = datetime.now(timezone.utc)
+
+    async with SessionLocal() as s:
+        raw_days = settings.history_raw_retention_days
+        if raw_days > 0:
+            await s.execute(
+                delete(RackSensorHistory).where(RackSensorHistory.created_at < now - timedelta(days=raw_days))
+            )
+
+        minute_days = settings.history_minute_rollup_retention_days
+        if minute_days > 0:
+            await s.execute(
+                delete(RackSensorRollup).where(
+                    RackSensorRollup.resolution_sec == RESOLUTIONS[0],
+                    RackSensorRollup.bucket_start < _epoch(now - timedelta(days=minute_days)),
+                )
+            )
+
+        await s.commit()
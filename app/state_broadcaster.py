@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any, Optional
+
+from . import runtime
+from .rack_state_store import rack_state_store
+from .routes_state import collect_state
+from .sensor_poller import sensor_poller
+
+# Должно совпадать с порогом «устаревших» данных датчика в app.js (soilInfoHtml).
+SOIL_STALE_SEC = 60
+
+# Сколько сообщений может ждать отправки одному клиенту. Кто отстал сильнее —
+# получает вместо накопленных diff один свежий snapshot.
+_QUEUE_SIZE = 16
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _compare_key(rack: dict) -> dict:
+    # soil_age_sec растёт каждую секунду — его клиент досчитывает сам.
+    # Рассылаем только момент, когда данные стали устаревшими (или снова свежими).
+    key = dict(rack)
+    age = key.pop("soil_age_sec", None)
+    key["_soil_stale"] = age is not None and age > SOIL_STALE_SEC
+    return key
+
+
+class StateBroadcaster:
+    """
+    Один источник push-обновлений для всех открытых дашбордов (/api/stream/state).
+
+    Состояние собирается один раз на изменение (реле, режим, датчик, вход) — не на клиента,
+    поэтому нагрузка не растёт с числом вкладок. Клиенты получают snapshot при подключении,
+    потом только diff по изменившимся полкам и heartbeat.
+    """
+
+    def __init__(self, heartbeat_sec: float = 15.0, tick_sec: float = 2.0, debounce_sec: float = 0.1):
+        self.heartbeat_sec = heartbeat_sec
+        self.tick_sec = tick_sec
+        self.debounce_sec = debounce_sec
+
+        self._subscribers: set[asyncio.Queue] = set()
+        self._changed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._running = False
+        self._loop_ref: Optional[asyncio.AbstractEventLoop] = None
+
+        self._racks: dict[int, dict] = {}
+        self._keys: dict[int, dict] = {}
+        self._inputs: Optional[dict[str, bool]] = None
+        self._last_sent = 0.0
+
+    def notify(self, *_):
+        """Что-то в состоянии изменилось — пересобрать и разослать diff."""
+        self._changed.set()
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        rack_state_store.add_listener(self.notify)
+        sensor_poller.add_listener(self.notify)
+        self._loop_ref = asyncio.get_running_loop()
+        runtime.inputs_listeners.append(self._notify_threadsafe)
+        self._running = True
+        self._task = asyncio.create_task(self._loop())
+
+    def _notify_threadsafe(self, *_):
+        # Датчики уровня сообщают об изменении из своего потока.
+        try:
+            self._loop_ref.call_soon_threadsafe(self.notify)
+        except RuntimeError:
+            # Event loop уже закрыт (остановка приложения).
+            pass
+
+    async def stop(self):
+        self._running = False
+        rack_state_store.remove_listener(self.notify)
+        sensor_poller.remove_listener(self.notify)
+        if self._notify_threadsafe in runtime.inputs_listeners:
+            runtime.inputs_listeners.remove(self._notify_threadsafe)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Разбудить генераторы ответов, чтобы соединения закрылись. Сигнал закрытия ("")
+        # не должен превратиться в snapshot у отставшего клиента — очередь очищаем сами.
+        for q in list(self._subscribers):
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait("")
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    async def subscribe(self) -> asyncio.Queue:
+        if not self._subscribers:
+            # Пока клиентов не было, состояние не собиралось — освежаем перед snapshot.
+            await self._refresh()
+        q: asyncio.Queue = asyncio.Queue(maxsize=_QUEUE_SIZE)
+        self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        self._subscribers.discard(q)
+
+    def snapshot_message(self) -> str:
+        return _sse("snapshot", {
+            "racks": [self._racks[rid] for rid in sorted(self._racks)],
+            "inputs": self._inputs,
+            "ts": time.time(),
+        })
+
+    def _put(self, q: asyncio.Queue, msg: Optional[str]):
+        try:
+            q.put_nowait(msg)
+        except asyncio.QueueFull:
+            # Медленный клиент: выбрасываем накопленное, ему уйдёт полный snapshot (None).
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait(None)
+
+    def _publish(self, msg: str):
+        for q in list(self._subscribers):
+            self._put(q, msg)
+        self._last_sent = time.monotonic()
+
+    def _read_inputs(self) -> Optional[dict[str, bool]]:
+        inputs = runtime.inputs
+        if not inputs:
+            return None
+        # Готовое состояние из памяти InputsDriver, GPIO здесь не читается.
+        return inputs.snapshot()
+
+    async def _refresh(self) -> Optional[dict]:
+        """Пересобирает состояние; возвращает diff относительно прошлого (None — ничего не изменилось)."""
+        racks = {r.rack_id: r.model_dump() for r in collect_state()}
+        keys = {rid: _compare_key(r) for rid, r in racks.items()}
+
+        changed = [racks[rid] for rid in sorted(racks) if self._keys.get(rid) != keys[rid]]
+        removed = sorted(set(self._racks) - set(racks))
+        self._racks = racks
+        self._keys = keys
+
+        diff: dict[str, Any] = {}
+        if changed:
+            diff["racks"] = changed
+        if removed:
+            diff["removed"] = removed
+
+        levels = self._read_inputs()
+        if levels != self._inputs:
+            self._inputs = levels
+            diff["inputs"] = levels
+
+        return diff or None
+
+    async def _loop(self):
+        while self._running:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=self.tick_sec)
+                # Собираем пачку изменений одного тика/одной команды в один diff.
+                await asyncio.sleep(self.debounce_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+
+            if not self._subscribers:
+                continue
+
+            try:
+                diff = await self._refresh()
+            except Exception as e:
+                print(f"[stream] refresh error: {e}")
+                continue
+
+            if diff:
+                diff["ts"] = time.time()
+                self._publish(_sse("diff", diff))
+            elif time.monotonic() - self._last_sent >= self.heartbeat_sec:
+                self._publish(_sse("heartbeat", {"ts": time.time()}))
+
+
+state_broadcaster = StateBroadcaster()
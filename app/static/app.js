@@ -102,10 +102,17 @@ function soilInfoHtml(r){
     ? `🌡 Темп.: <b>${Number(r.soil_temperature).toFixed(1)}°C</b>`
     : `🌡 Темп.: <b>—</b>`;
 
+  // Данные берутся из кэша опроса датчиков; если датчик давно не отвечает — помечаем.
+  const stale = r.soil_age_sec !== null && r.soil_age_sec !== undefined && r.soil_age_sec > 60;
+  const staleText = stale
+    ? `<span class="soilBadge muted" title="${escapeHtml(r.soil_error || "")}">⏱ ${Math.round(r.soil_age_sec)} с назад</span>`
+    : "";
+
   return `
     <div class="soilLine">
       <span class="soilBadge">${moistureText}</span>
       <span class="soilBadge">${tempText}</span>
+      ${staleText}
     </div>
   `;
 }
@@ -232,10 +239,34 @@ function cardHtml(r){
   </div>`;
 }
 
+// Последнее известное состояние полок: rackId -> объект из /api/state.
+// receivedAt нужен, чтобы досчитывать возраст данных датчика между сообщениями сервера.
+let racksById = new Map();
+
+function setRacks(list, replaceAll){
+  if(replaceAll) racksById = new Map();
+  const now = Date.now();
+  for(const r of list){
+    racksById.set(r.rack_id, {...r, receivedAt: now});
+  }
+}
+
+function renderCards(){
+  const now = Date.now();
+  const data = [...racksById.values()]
+    .sort((a, b) => a.rack_id - b.rack_id)
+    .map(r => {
+      if(r.soil_age_sec === null || r.soil_age_sec === undefined) return r;
+      return {...r, soil_age_sec: r.soil_age_sec + (now - r.receivedAt) / 1000};
+    });
+  document.getElementById("cards").innerHTML = data.map(cardHtml).join("");
+}
+
 async function refresh(){
   try{
     const data = await api("/api/state");
-    document.getElementById("cards").innerHTML = data.map(cardHtml).join("");
+    setRacks(data, true);
+    renderCards();
     setConn(true);
   }catch(e){
     console.error(e);
@@ -244,10 +275,65 @@ async function refresh(){
 }
 
 function startAutoRefresh(){
-  if(refreshTimer) clearInterval(refreshTimer);
+  if(refreshTimer) return;
   refreshTimer = setInterval(()=>{ if(!isBusy) refresh(); }, 2000);
 }
 
+function stopAutoRefresh(){
+  if(refreshTimer) clearInterval(refreshTimer);
+  refreshTimer = null;
+}
+
+/* ===== Push-обновления (SSE) ===== */
+// Сервер сам присылает изменения. Опрос /api/state включается, только пока поток недоступен.
+
+let stateStream = null;
+
+function onStreamMessage(handler){
+  return (ev)=>{
+    try{
+      handler(JSON.parse(ev.data));
+    }catch(e){
+      console.error(e);
+      return;
+    }
+    setConn(true);
+    if(!isBusy) renderCards();
+  };
+}
+
+function startStateStream(){
+  if(!window.EventSource){
+    startAutoRefresh();
+    return;
+  }
+
+  stateStream = new EventSource("/api/stream/state");
+
+  stateStream.addEventListener("snapshot", onStreamMessage(msg => {
+    setRacks(msg.racks || [], true);
+  }));
+
+  stateStream.addEventListener("diff", onStreamMessage(msg => {
+    if(msg.racks) setRacks(msg.racks, false);
+    for(const id of (msg.removed || [])) racksById.delete(id);
+  }));
+
+  // heartbeat ничего не меняет, но перерисовка обновляет «N с назад» у датчиков
+  stateStream.addEventListener("heartbeat", onStreamMessage(()=>{}));
+
+  stateStream.onopen = ()=>{
+    stopAutoRefresh();
+    setConn(true);
+  };
+
+  stateStream.onerror = ()=>{
+    // EventSource переподключается сам; до этого момента живём на опросе.
+    setConn(false);
+    startAutoRefresh();
+  };
+}
+
 function setConn(ok){
   const el = document.getElementById("conn");
   el.textContent = ok ? "🟢 онлайн" : "🔴 нет связи";
@@ -971,4 +1057,4 @@ document.getElementById("cfgRacksCount").addEventListener("change", (e)=>cfgRack
 
 initCameraWindowDrag();
 refresh();
-startAutoRefresh();
+startStateStream();
@@ -48,11 +48,14 @@ function buildChart(canvasId, datasets, labels){
   });
 }
 
+const MAX_CHART_POINTS = 500;
+
 async function loadCharts(){
   const rackId = document.getElementById("rackSelect").value;
   const hours = document.getElementById("hoursSelect").value;
 
-  let url = `/api/sensor-history?hours=${hours}`;
+  // Сервер усредняет точки по интервалам: размер ответа не зависит от периода.
+  let url = `/api/sensor-history?hours=${hours}&max_points=${MAX_CHART_POINTS}`;
   if(rackId !== "all"){
     url += `&rack_id=${rackId}`;
   }
@@ -18,6 +18,9 @@ instr.clear_buffers_before_each_transaction = True
 RELAY_ON  = 0x0100
 RELAY_OFF = 0x0200
 
+# Пауза между кадрами Modbus RTU: 3.5 символа по 10 бит (8N1); выше 19200 бод — 1.75 мс.
+FRAME_GAP = 3.5 * 10 / BAUDRATE if BAUDRATE <= 19200 else 0.00175
+
 
 def relay_on(channel: int):
     """
@@ -27,7 +30,7 @@ def relay_on(channel: int):
         raise ValueError("Channel must be 1..16")
 
     instr.write_register(channel, RELAY_ON, functioncode=6)
-    time.sleep(0.05)
+    time.sleep(FRAME_GAP)
 
 
 def relay_off(channel: int):
@@ -38,7 +41,7 @@ def relay_off(channel: int):
         raise ValueError("Channel must be 1..16")
 
     instr.write_register(channel, RELAY_OFF, functioncode=6)
-    time.sleep(0.05)
+    time.sleep(FRAME_GAP)
 
 
 def relay_set(channel: int, state: bool):
@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Optional
+
+from sqlalchemy import delete, func, select, true, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import runtime
+from .db import SessionLocal
+from .google_drive_uploader import GoogleDriveUploader
+from .models import CameraUpload
+
+# Первая пауза после ошибки; дальше удваивается до upload_retry_max_seconds
+_RETRY_BASE_SEC = 5
+
+# За какой период считать скорость отправки в /api/camera/uploads
+_THROUGHPUT_WINDOW_SEC = 600
+
+
+def pending_dir() -> Path:
+    if runtime.cfg and runtime.cfg.camera_capture:
+        return Path(runtime.cfg.camera_capture.pending_dir or "data/camera_pending")
+    return Path("data/camera_pending")
+
+
+@dataclass
+class _Job:
+    id: int
+    path: str
+    filename: str
+    size: int
+    attempts: int
+    resumable_uri: Optional[str]
+
+
+class UploadQueue:
+    """
+    Очередь отправки фото в Google Drive.
+
+    Файлы лежат в pending_dir, а список — в таблице camera_upload_queue, поэтому
+    каталог не пересканируется каждый цикл (только один раз при старте — подобрать
+    файлы, оставшиеся от старой версии или от аварийного выключения).
+
+    Работает по своему расписанию, независимо от съёмки: до upload_concurrency
+    загрузок одновременно, у каждой свой GoogleDriveUploader (клиент Google API
+    не потокобезопасен). После ошибки файл откладывается с экспоненциальной паузой,
+    а вся очередь — на паузу, растущую с числом ошибок подряд (нет интернета —
+    не перебираем весь архив). Большие файлы докачиваются resumable-сессией.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._running = False
+        self._wake = asyncio.Event()
+        self._uploads: set[asyncio.Task] = set()
+        self._in_flight: set[int] = set()
+
+        self._idle_uploaders: list[GoogleDriveUploader] = []
+        self._uploader_key: Optional[tuple] = None
+        self._configured: Optional[bool] = None
+
+        self._failures = 0
+        self._paused_until = 0.0
+        self._started_at = time.monotonic()
+        self._done: deque[tuple[float, int]] = deque()
+
+        self.uploaded_total = 0
+        self.failed_total = 0
+        self.bytes_uploaded_total = 0
+        self.last_error: Optional[str] = None
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        self._running = True
+        self._started_at = time.monotonic()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        self._running = False
+        tasks = [t for t in (self._task, *self._uploads) if t]
+        for t in tasks:
+            t.cancel()
+        # Незавершённые загрузки останутся в таблице и продолжатся после перезапуска.
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def enqueue(self, path: Path | str):
+        path = str(path)
+        size = await asyncio.to_thread(os.path.getsize, path)
+        async with SessionLocal() as s:
+            await s.execute(
+                sqlite_insert(CameraUpload)
+                .values(path=path, filename=os.path.basename(path), size=size)
+                .on_conflict_do_nothing(index_elements=["path"])
+            )
+            await s.commit()
+        self._wake.set()
+
+    def _cfg(self):
+        return runtime.cfg.camera_capture if runtime.cfg else None
+
+    def _check_configured(self, cfg) -> bool:
+        configured = bool(cfg and cfg.credentials_file and cfg.google_folder_id and cfg.token_file)
+        if configured != self._configured:
+            self._configured = configured
+            if not configured:
+                print("[upload-queue] Google Drive не настроен: credentials_file, token_file или google_folder_id пустые")
+        if not configured:
+            return False
+
+        key = (cfg.credentials_file, cfg.google_folder_id, cfg.token_file)
+        if key != self._uploader_key:
+            self._idle_uploaders.clear()
+            self._uploader_key = key
+        return True
+
+    def _take_uploader(self) -> GoogleDriveUploader:
+        if self._idle_uploaders:
+            return self._idle_uploaders.pop()
+        credentials_file, folder_id, token_file = self._uploader_key
+        return GoogleDriveUploader(credentials_file=credentials_file, folder_id=folder_id, token_file=token_file)
+
+    def _give_uploader(self, uploader: GoogleDriveUploader, key: Optional[tuple], limit: int):
+        # Загрузчик от старых настроек Drive или сверх лимита параллельности не храним.
+        if key == self._uploader_key and len(self._idle_uploaders) < limit:
+            self._idle_uploaders.append(uploader)
+
+    async def _loop(self):
+        try:
+            await self._reconcile()
+        except Exception as e:
+            print(f"[upload-queue] reconcile error: {e}")
+
+        while self._running:
+            cfg = self._cfg()
+            timeout = float(cfg.upload_interval_seconds if cfg else 30)
+
+            try:
+                if self._check_configured(cfg):
+                    paused = self._paused_until - time.monotonic()
+                    if paused > 0:
+                        timeout = min(timeout, paused)
+                    else:
+                        free = cfg.upload_concurrency - len(self._in_flight)
+                        next_due = None
+                        if free > 0:
+                            jobs, next_due = await self._claim(free)
+                            for job in jobs:
+                                self._start_upload(job, cfg.upload_concurrency)
+                        if next_due is not None:
+                            timeout = min(timeout, max(0.5, (next_due - datetime.utcnow()).total_seconds()))
+            except Exception as e:
+                print(f"[upload-queue] error: {e}")
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _reconcile(self):
+        """Сверяет таблицу с каталогом: новые файлы — в очередь, строки без файлов — удалить."""
+        directory = pending_dir()
+
+        def scan() -> dict[str, tuple[int, float]]:
+            if not directory.exists():
+                return {}
+            out = {}
+            for p in directory.glob("*.jpg"):
+                st = p.stat()
+                out[str(p)] = (st.st_size, st.st_mtime)
+            return out
+
+        files = await asyncio.to_thread(scan)
+
+        async with SessionLocal() as s:
+            known = set((await s.execute(select(CameraUpload.path))).scalars().all())
+
+            missing = known - set(files)
+            if missing:
+                await s.execute(delete(CameraUpload).where(CameraUpload.path.in_(missing)))
+
+            new = [
+                {
+                    "path": path,
+                    "filename": os.path.basename(path),
+                    "size": size,
+                    "created_at": datetime.utcfromtimestamp(mtime),
+                    "next_attempt_at": datetime.utcnow(),
+                }
+                for path, (size, mtime) in sorted(files.items())
+                if path not in known
+            ]
+            if new:
+                await s.execute(sqlite_insert(CameraUpload).on_conflict_do_nothing(index_elements=["path"]), new)
+            await s.commit()
+
+        if new or missing:
+            print(f"[upload-queue] reconcile: added {len(new)} files, dropped {len(missing)} stale entries")
+
+    async def _claim(self, limit: int) -> tuple[list[_Job], Optional[datetime]]:
+        """До limit файлов, которым пора отправляться, и время ближайшей отложенной попытки."""
+        q = CameraUpload
+        not_busy = q.id.not_in(self._in_flight) if self._in_flight else true()
+
+        async with SessionLocal() as s:
+            rows = (await s.execute(
+                select(q.id, q.path, q.filename, q.size, q.attempts, q.resumable_uri)
+                .where(not_busy, q.next_attempt_at <= datetime.utcnow())
+                .order_by(q.id)
+                .limit(limit)
+            )).all()
+            next_due = None
+            if len(rows) < limit:
+                claimed = [r.id for r in rows]
+                next_due = await s.scalar(
+                    select(func.min(q.next_attempt_at)).where(not_busy, q.id.not_in(claimed))
+                )
+
+        return [_Job(*row) for row in rows], next_due
+
+    def _start_upload(self, job: _Job, limit: int):
+        self._in_flight.add(job.id)
+        task = asyncio.create_task(self._upload(job, limit))
+        self._uploads.add(task)
+        task.add_done_callback(self._uploads.discard)
+
+    async def _upload(self, job: _Job, limit: int):
+        key = self._uploader_key
+        uploader = self._take_uploader()
+        session = {"uri": job.resumable_uri}
+
+        try:
+            if not await asyncio.to_thread(os.path.exists, job.path):
+                await self._forget(job)
+                print(f"[upload-queue] file is gone, dropped: {job.path}")
+                return
+
+            result = await asyncio.to_thread(uploader.upload_file, job.path, job.filename, session)
+
+        except asyncio.CancelledError:
+            await asyncio.shield(self._save_session(job, session.get("uri")))
+            raise
+
+        except Exception as e:
+            # После сетевой ошибки лучше пересоздать клиентов Google Drive при следующей попытке.
+            uploader.reset()
+            await self._failed(job, e, session.get("uri"))
+
+        else:
+            await asyncio.to_thread(Path(job.path).unlink, missing_ok=True)
+            await self._forget(job)
+
+            self._failures = 0
+            self.uploaded_total += 1
+            self.bytes_uploaded_total += job.size
+            self._done.append((time.monotonic(), job.size))
+            print(f"[upload-queue] uploaded {job.filename}: {result}")
+
+        finally:
+            self._in_flight.discard(job.id)
+            self._give_uploader(uploader, key, limit)
+            self._wake.set()
+
+    async def _forget(self, job: _Job):
+        async with SessionLocal() as s:
+            await s.execute(delete(CameraUpload).where(CameraUpload.id == job.id))
+            await s.commit()
+
+    async def _save_session(self, job: _Job, uri: Optional[str]):
+        if uri == job.resumable_uri:
+            return
+        async with SessionLocal() as s:
+            await s.execute(update(CameraUpload).where(CameraUpload.id == job.id).values(resumable_uri=uri))
+            await s.commit()
+
+    async def _failed(self, job: _Job, error: Exception, uri: Optional[str]):
+        cfg = self._cfg()
+        max_delay = cfg.upload_retry_max_seconds if cfg else 900
+
+        attempts = job.attempts + 1
+        delay = min(max_delay, _RETRY_BASE_SEC * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+
+        # Пока очередь на паузе, остальные параллельные ошибки — та же авария, а не новая.
+        now = time.monotonic()
+        if now >= self._paused_until:
+            self._failures += 1
+            self._paused_until = now + min(max_delay, _RETRY_BASE_SEC * 2 ** (self._failures - 1))
+
+        self.failed_total += 1
+        self.last_error = f"{job.filename}: {error}"
+        print(f"[upload-queue] cannot upload {job.filename} (attempt {attempts}): {error}")
+
+        async with SessionLocal() as s:
+            await s.execute(
+                update(CameraUpload)
+                .where(CameraUpload.id == job.id)
+                .values(
+                    attempts=attempts,
+                    next_attempt_at=datetime.utcnow() + timedelta(seconds=delay),
+                    last_error=str(error)[:500],
+                    resumable_uri=uri,
+                )
+            )
+            await s.commit()
+
+    async def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        while self._done and self._done[0][0] < now - _THROUGHPUT_WINDOW_SEC:
+            self._done.popleft()
+        window = max(1.0, min(_THROUGHPUT_WINDOW_SEC, now - self._started_at))
+        recent_bytes = sum(size for _, size in self._done)
+
+        q = CameraUpload
+        async with SessionLocal() as s:
+            depth, pending_bytes, oldest = (await s.execute(
+                select(func.count(), func.coalesce(func.sum(q.size), 0), func.min(q.created_at))
+            )).one()
+            due = await s.scalar(select(func.count()).where(q.next_attempt_at <= datetime.utcnow()))
+
+        cfg = self._cfg()
+        return {
+            "configured": bool(self._configured),
+            "depth": depth,
+            "pending_bytes": pending_bytes,
+            "due": due,
+            "in_flight": len(self._in_flight),
+            "concurrency": cfg.upload_concurrency if cfg else None,
+            "oldest_created_at": oldest.isoformat() + "Z" if oldest else None,
+            "uploaded_total": self.uploaded_total,
+            "failed_total": self.failed_total,
+            "bytes_uploaded_total": self.bytes_uploaded_total,
+            "throughput": {
+                "window_sec": round(window),
+                "files_per_min": round(len(self._done) * 60 / window, 2),
+                "bytes_per_sec": round(recent_bytes / window),
+            },
+            "consecutive_failures": self._failures,
+            "retry_in_sec": round(max(0.0, self._paused_until - now), 1),
+            "last_error": self.last_error,
+        }
+
+
+upload_queue = UploadQueue()